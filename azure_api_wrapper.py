@@ -17,9 +17,7 @@ from msrest.authentication import CognitiveServicesCredentials
 from azure.cognitiveservices.vision.face.models import TrainingStatusType, Person, QualityForRecognition
 import cv2
 
-
-NO_EXCEPTION_MSG = 'no exception'
-NO_ITERATION_MSG = 'no further iteration'
+from emotion_backend import EmotionBackend, NO_EXCEPTION_MSG, NO_ITERATION_MSG
 
 
 # Azure Face API
@@ -27,17 +25,38 @@ NO_ITERATION_MSG = 'no further iteration'
 # Note:
 #   Module for inferencing facial emotion and reliability from image source
 #   gets image and returns probability of emotions
+#   Image source can be a frame (numpy array), encoded JPEG bytes or a path of image file
+#   Frames are encoded only once in memory (resized to 'max_width' with 'jpeg_quality')
 #   API link: https://docs.microsoft.com/ko-kr/azure/cognitive-services/face/
 #   Copied and made a small modification from official documentation 
 #   https://docs.microsoft.com/ko-kr/azure/cognitive-services/face/quickstarts/client-libraries?tabs=visual-studio&pivots=programming-language-python
 
-class AzureFaceApi:
-    def __init__(self, apikey, endpoint):
+class AzureFaceApi(EmotionBackend):
+    name = 'azure'
+
+    def __init__(self, apikey, endpoint, jpeg_quality=85, max_width=640):
         self.endpoint = 'https://' + endpoint + '.cognitiveservices.azure.com/'
         self.apikey = apikey
+        self.jpeg_quality = jpeg_quality
+        self.max_width = max_width
         self.face_client = FaceClient(self.endpoint, CognitiveServicesCredentials(self.apikey))
 
-    def detect_face_src(self, image_path):
+    def encode_image(self, image):
+        if isinstance(image, (bytes, bytearray, memoryview)):  # already encoded
+            return bytes(image)
+        if isinstance(image, str):  # image file (sent as it is)
+            with open(image, 'rb') as image_file:
+                return image_file.read()
+
+        height, width = image.shape[:2]
+        if self.max_width is not None and width > self.max_width:
+            image = cv2.resize(image, (self.max_width, int(height * self.max_width / width)), interpolation=cv2.INTER_AREA)
+        ret, buf = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, int(self.jpeg_quality)])
+        if not ret:
+            raise ValueError('cannot encode image as JPEG')
+        return buf.tobytes()
+
+    def detect_face_src(self, image, box=None):  # face box is not used (detected again by face api)
         if self.apikey is None:
             raise Exception('FACE_API_KEY required: initialize FACE_API_KEY variable')
 
@@ -45,9 +64,13 @@ class AzureFaceApi:
         j = json.loads('{}')
 
         logging.info('[FACE API] Generating img stream')
-        frame = cv2.imread(image_path)
-        _, buf = cv2.imencode('.jpg', frame) # ret
-        stream = io.BytesIO(buf)
+        try:
+            stream = io.BytesIO(self.encode_image(image))
+        except Exception as error:
+            logging.error(f'[FACE API] Error ocurred on encoding image: {error}')
+            msg = {'exception': 'Image encoding error'}
+            j.update(msg)
+            return j
 
         logging.info('[FACE API] Detecting emotion')
         try:
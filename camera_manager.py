@@ -0,0 +1,154 @@
+import logging
+import time
+import threading
+import collections
+
+import cv2
+
+
+# Camera manager
+#
+# Note:
+#   Owns the camera device and shares it with face emotion detection and style recommendation
+#   Background thread keeps the most recent frames in a ring buffer while the camera is in use
+#   Frames are handed out as read-only views (no copy), so consumers must copy before modifying them
+#   Camera is released after 'camera-idle-timeout' seconds without any consumer
+#   Settings are read from the device configuration of data manager ('camera-*' keys)
+#
+#   Usage:
+#     camera = CameraManager.instance()
+#     index, frame = camera.read()                 # most recent frame
+#     index, frame = camera.read(after=index)      # wait for the next frame
+#     frames = camera.recent(4)                    # up to 4 most recent (index, frame) pairs (oldest first)
+#     frames = camera.recent(4, after=index)       # wait for frames newer than the index
+
+class CameraManager:
+    _instance = None
+    _instanceLock = threading.Lock()
+
+    @classmethod
+    def instance(cls):
+        with cls._instanceLock:
+            if cls._instance is None:
+                from data_manager import configurations  # camera is loaded by the feature registry of data manager
+                cls._instance = CameraManager(device=configurations['camera-device-index'],
+                                              bufferSize=configurations['camera-buffer-size'],
+                                              idleTimeout=configurations['camera-idle-timeout'])
+            return cls._instance
+
+    def __init__(self, device=0, bufferSize=8, idleTimeout=30, warmupFrames=5, maxReadFailures=10):
+        self.device = device
+        self.idleTimeout = idleTimeout
+        self.warmupFrames = warmupFrames  # frames dropped while auto exposure settles
+        self.maxReadFailures = maxReadFailures
+        self.frames = collections.deque(maxlen=bufferSize)  # (frame index, capture time, frame)
+        self.frameCount = 0
+        self.available = True
+        self.lastAccess = time.monotonic()
+        self._running = False
+        self._thread = None
+        self._condition = threading.Condition()
+
+    def start(self):
+        with self._condition:
+            self.lastAccess = time.monotonic()
+            if self._running:
+                return
+            self._running = True
+            self.available = True
+            previous = self._thread
+            self._thread = threading.Thread(target=self._run, args=(previous,), name='camera', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def isRunning(self):
+        return self._running
+
+    def read(self, after=None, timeout=3.0):
+        self.start()
+        with self._condition:
+            self._condition.wait_for(lambda: self._hasFrameAfter(after) or not self._running, timeout)
+            self.lastAccess = time.monotonic()
+            if not self._hasFrameAfter(after):
+                return None, None
+            index, _, frame = self.frames[-1]
+            return index, frame.view()
+
+    def recent(self, count=None, after=None, timeout=3.0):
+        self.start()
+        with self._condition:
+            self._condition.wait_for(lambda: self._hasFrameAfter(after) or not self._running, timeout)
+            self.lastAccess = time.monotonic()
+            frames = [(index, frame) for index, _, frame in self.frames if after is None or index > after]
+        if count is not None:
+            frames = frames[-count:]
+        return [(index, frame.view()) for index, frame in frames]
+
+    def _hasFrameAfter(self, after):
+        if len(self.frames) == 0:
+            return False
+        return after is None or self.frames[-1][0] > after
+
+    def _run(self, previous):
+        if previous is not None:
+            previous.join()  # wait until the previous session releases the device
+
+        logging.info(f'[CAMERA] Opening camera device {self.device}')
+        start = time.perf_counter()
+        cap = cv2.VideoCapture(self.device)
+        failures = 0
+        dropped = 0
+        published = False
+
+        try:
+            if not cap.isOpened():
+                logging.error(f'[CAMERA] Camera device {self.device} is not available')
+                with self._condition:
+                    self.available = False
+                return
+
+            while self._running:
+                with self._condition:
+                    if time.monotonic() - self.lastAccess > self.idleTimeout:
+                        logging.info('[CAMERA] Camera is idle: powering down')
+                        self._running = False
+                        self.frames.clear()
+                        break
+
+                ret, frame = cap.read()
+                if not ret:
+                    failures += 1
+                    if failures >= self.maxReadFailures:
+                        logging.error('[CAMERA] Frame capture error occurred repeatedly: closing camera')
+                        with self._condition:
+                            self.available = False
+                        break
+                    time.sleep(0.05)
+                    continue
+                failures = 0
+
+                if dropped < self.warmupFrames:
+                    dropped += 1
+                    continue
+                if not published:
+                    published = True
+                    logging.info(f'[CAMERA] First usable frame after {(time.perf_counter() - start) * 1000:.1f}ms')
+
+                frame.flags.writeable = False  # shared with every consumer
+                with self._condition:
+                    self.frameCount += 1
+                    self.frames.append((self.frameCount, time.monotonic(), frame))
+                    self._condition.notify_all()
+        finally:
+            cap.release()
+            with self._condition:
+                if self._thread is threading.current_thread():
+                    self._running = False
+                    self.frames.clear()
+                self._condition.notify_all()
@@ -5,59 +5,172 @@ import json
 import os.path
 import logging
 import datetime
+import importlib
+import contextlib
+import collections
 import subprocess
-import cv2
+import sqlite3
+import threading
+import time
+import types
+import hashlib
+import re
+import urllib.parse
 
 from gi.repository import GObject as gobject
 
-# Google OAuth2 requirements
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload, MediaIoBaseUpload
-from googleapiclient.errors import HttpError
+# Other requirements (cv2, google API client, bluetooth, pafy, vlc ...) are imported lazily
+# by the feature registry (see 'Feature registry' section)
 
-# Bluetooth requirements (pybluez lib)
-import bluetooth
 
-# Other requirements import code are at 'Reading device configuration' section
+# Startup timeline
+#
+# Note:
+#   Records how long each import and initialization step takes (in milliseconds)
+#   Use 'report' method to get the timeline and 'log' method to print it
+
+class StartupTimeline:
+    def __init__(self) -> None:
+        self.origin = time.perf_counter()
+        self.records = []  # (name, kind, start time, elapsed time)
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def measure(self, name, kind='init'):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            with self._lock:
+                self.records.append((name, kind, (start - self.origin) * 1000, (end - start) * 1000))
+
+    def report(self):
+        with self._lock:
+            return [{'name': name, 'kind': kind, 'start': start, 'elapsed': elapsed}
+                    for name, kind, start, elapsed in sorted(self.records, key=lambda record: record[2])]
+
+    def log(self):
+        for record in self.report():
+            logging.info(f"[STARTUP] {record['kind']:>7} {record['name']:<24} at {record['start']:8.1f}ms took {record['elapsed']:8.1f}ms")
+
+startupTimeline = StartupTimeline()
+
+def importModule(name):
+    with startupTimeline.measure(name, 'import'):
+        return importlib.import_module(name)
 
 
 # Data Manager Init Listener
 # 
 # Note:
-#   Checks whether device is already initialized
+#   Schedules device initialization steps and checks whether device is already initialized
 #   Needs to be initialized:
 #     * readApikey: read API keys
 #     * readDeviceConfig: read device configuration
 #     * readSettings: read device settings from local storage
+#     * wifiConnection: wait until the device is connected to the internet
 #     * googleAccountAuth: get authentication for user's google account
 #     * googleAssistantAuth: get authentivation for google assistant SDK
+#
+#   Steps registered with 'register' run on their own thread as soon as their dependencies
+#   are initialized, so independent steps (ex. account and assistant auth) run concurrently
+#   Use 'wait' to block until steps are done instead of polling 'isInitialized'
+#   Steps whose dependency failed are marked as failed without running
 
 class DataManagerInitListener:
     INITIALIZED = 0
     NOT_INITIALIZED = 1
+    RUNNING = 2
+    FAILED = 3
 
     def __init__(self) -> None:
         self.states = {
             'readApikey': DataManagerInitListener.NOT_INITIALIZED,
             'readDeviceConfig': DataManagerInitListener.NOT_INITIALIZED,
             'readSettings': DataManagerInitListener.NOT_INITIALIZED,
+            'wifiConnection': DataManagerInitListener.NOT_INITIALIZED,
             'googleAccountAuth': DataManagerInitListener.NOT_INITIALIZED,
             'googleAssistantAuth': DataManagerInitListener.NOT_INITIALIZED,
         }
-    
-    def setInitialized(self, key):
-        if key in self.states.keys():
-            self.states[key] = DataManagerInitListener.INITIALIZED
+        self.steps = {}    # key -> (step method, dependencies)
+        self.timings = {}  # key -> elapsed time (ms)
+        self._started = False
+        self._condition = threading.Condition()
+
+    def register(self, key, method, *dependencies):
+        with self._condition:
+            self.steps[key] = (method, dependencies)
+        if self._started:
+            self._launchReadySteps()
+
+    def start(self):
+        self._started = True
+        self._launchReadySteps()
+
+    @contextlib.contextmanager
+    def step(self, key):  # runs a step on the caller's thread
+        start = time.perf_counter()
+        with startupTimeline.measure(key, 'init'):
+            yield
+        self.timings[key] = (time.perf_counter() - start) * 1000
+        self.setInitialized(key)
 
-    def isInitialized(self):
-        for value in self.states.values():
-            if value != DataManagerInitListener.INITIALIZED:
+    def setInitialized(self, key):
+        with self._condition:
+            if key in self.states.keys():
+                self.states[key] = DataManagerInitListener.INITIALIZED
+            self._condition.notify_all()
+        if self._started:
+            self._launchReadySteps()
+
+    def isInitialized(self, keys=None):
+        with self._condition:
+            return self._isDone(keys, DataManagerInitListener.INITIALIZED)
+
+    def wait(self, keys=None, timeout=None):
+        with self._condition:
+            self._condition.wait_for(lambda: self._isDone(keys, DataManagerInitListener.INITIALIZED, DataManagerInitListener.FAILED), timeout)
+            return self._isDone(keys, DataManagerInitListener.INITIALIZED)
+
+    def _isDone(self, keys, *doneStates):
+        for key, value in self.states.items():
+            if keys is not None and key not in keys:
+                continue
+            if value not in doneStates:
                 return False
         return True
 
+    def _launchReadySteps(self):
+        ready = []
+        with self._condition:
+            for key, (method, dependencies) in self.steps.items():
+                if self.states.get(key) != DataManagerInitListener.NOT_INITIALIZED:
+                    continue
+                if any(self.states.get(dependency) == DataManagerInitListener.FAILED for dependency in dependencies):
+                    logging.error(f'[DATA MANAGER] Initialization step {key} failed: dependency failed')
+                    self.states[key] = DataManagerInitListener.FAILED
+                    self._condition.notify_all()
+                    continue
+                if all(self.states.get(dependency) == DataManagerInitListener.INITIALIZED for dependency in dependencies):
+                    self.states[key] = DataManagerInitListener.RUNNING
+                    ready.append((key, method))
+
+        for key, method in ready:
+            threading.Thread(target=self._runStep, args=(key, method), name=f'init-{key}', daemon=True).start()
+
+    def _runStep(self, key, method):
+        try:
+            with self.step(key):
+                method()
+            logging.info(f'[DATA MANAGER] Initialized {key} ({self.timings[key]:.1f}ms)')
+        except Exception as error:
+            logging.error(f'[DATA MANAGER] Initialization step {key} failed: {error}')
+            with self._condition:
+                self.states[key] = DataManagerInitListener.FAILED
+                self._condition.notify_all()
+            self._launchReadySteps()  # steps depending on this step fail too
+
 dataManagerInitListener = DataManagerInitListener()
 
 
@@ -73,12 +186,12 @@ dataManagerInitListener = DataManagerInitListener()
 apikeys = {}
 apikeysDirectoryPath = os.path.join(os.path.curdir, 'assets', 'keys')
 
-with open(os.path.join('assets', 'keys', 'apikeys.json'), 'rt') as keyFile:
-    readApiKeys = json.loads(keyFile.read())
-    for k, v in readApiKeys.items():
-        apikeys[k] = v
+with dataManagerInitListener.step('readApikey'):
+    with open(os.path.join('assets', 'keys', 'apikeys.json'), 'rt') as keyFile:
+        readApiKeys = json.loads(keyFile.read())
+        for k, v in readApiKeys.items():
+            apikeys[k] = v
 
-dataManagerInitListener.setInitialized('readApikey')
 
 
 # Reading device configuration
@@ -89,20 +202,38 @@ dataManagerInitListener.setInitialized('readApikey')
 configurations = {
     "google-drive-enabled": False,
     "google-assistant-enabled": False,
+    "wifi-wait-warning-interval": 300,  # seconds; authentication steps keep waiting while offline and warn at this interval
     "youtube-music-enabled": False,
     "face-emotion-detection-enabled": False,
+    "camera-device-index": 0,   # video capture device shared by face emotion detection and style recommendation
+    "camera-buffer-size": 8,    # number of recent frames kept by the camera manager
+    "camera-idle-timeout": 30,  # seconds; camera is released when no frame is read for this time
+    "face-api-jpeg-quality": 85,  # JPEG quality of frames sent to azure face api
+    "face-api-max-width": 640,    # frames wider than this are downscaled before encoding
+    "face-detector-backend": "default",  # face detection DNN backend (default, opencv, openvino, cuda)
+    "face-detector-target": "cpu",       # face detection DNN target (cpu, opencl, opencl_fp16, myriad, cuda)
+    "face-emotion-backend": "azure",     # emotion inference backend (azure: Azure Face API, local: FER+ model on CPU)
+    "face-emotion-model": os.path.join('model', 'emotion-ferplus-8.onnx'),  # model of local emotion backend
+    "emotion-debounce-seconds": 60,        # emotion detected within this time is reused by emotion search
+    "youtube-search-cache-ttl": 6 * 3600,  # seconds until cached youtube search results expire
+    "youtube-search-cache-size": 20,       # number of cached youtube search result pages
+    "youtube-queue-window": 3,             # number of resolved tracks queued after the playing track
+    "youtube-skip-budget": 5,              # number of tracks skipped in a row before giving up playing
+    "youtube-audio-cache-mb": 0,           # size limit of local audio cache of played tracks (0: disabled)
+    "youtube-max-duration": 15 * 60,       # seconds; longer videos (and live streams) are not added to playlists
     "skin-condition-enabled": False,
     "style-recommendation-enabled": False,
     "device-logging-option": "INFO",
 }
 
-try:
-    with open('config.json', 'rt') as config:
-        content = json.loads(config.read())
-        for k, v in content.items():
-            configurations[k] = v
-except Exception as error:
-    logging.warning(f'[DATA MANAGER] config.json not found: {error}')
+with dataManagerInitListener.step('readDeviceConfig'):
+    try:
+        with open('config.json', 'rt') as config:
+            content = json.loads(config.read())
+            for k, v in content.items():
+                configurations[k] = v
+    except Exception as error:
+        logging.warning(f'[DATA MANAGER] config.json not found: {error}')
 
 if configurations['device-logging-option'] == "INFO":
     logging.basicConfig(level=logging.INFO)
@@ -115,20 +246,8 @@ elif configurations['device-logging-option'] == "ERROR":
 else:
     logging.basicConfig(level=logging.WARNING)
 
-# YouTube music player requirements
-if configurations['youtube-music-enabled']:
-    import pafy
-    import vlc
-
-# Face emotion detection requirements
-if configurations['face-emotion-detection-enabled']:
-    import face_emotion_detection
-
-# Reverse search API wrapper module
-if configurations['style-recommendation-enabled']:
-    import reverse_image_api_wrapper
+# Requirements of each feature are imported on first use (see 'Feature registry' section)
 
-dataManagerInitListener.setInitialized('readDeviceConfig')
 
 
 # Reading settings file
@@ -143,14 +262,15 @@ defaultApplicationSettings = {
     'refresh_term': 30,  # refresh term (initialized as 30 seconds)
 }
 
-with open('settings.json', 'rt') as settingsFile:
-    content = json.loads(settingsFile.read())
+with dataManagerInitListener.step('readSettings'):
+    with open('settings.json', 'rt') as settingsFile:
+        content = json.loads(settingsFile.read())
 
-    for name, value in defaultApplicationSettings.items():  # copy default settings
-        applicationSettings[name] = value
+        for name, value in defaultApplicationSettings.items():  # copy default settings
+            applicationSettings[name] = value
 
-    for name, value in content.items():  # read settings from settings file
-        applicationSettings[name.strip()] = value
+        for name, value in content.items():  # read settings from settings file
+            applicationSettings[name.strip()] = value
 
 def changeSettings(name, value):
     applicationSettings[name] = value
@@ -163,25 +283,201 @@ def saveSettings():
 def getSettings(name):
     return applicationSettings[name]
 
-dataManagerInitListener.setInitialized('readSettings')
 
 
 # Internet connection checker
+#
+# Note:
+#   ConnectivityMonitor keeps a shared connection state that is updated by a background thread
+#   Link state is read from '/sys/class/net' every poll interval, which costs no network traffic
+#   The HTTP probe only runs when the link state changes or the cached result is older than the ttl
+#   Use 'bind' method to get notified when the connection state changes
+#   (callbacks are called from the monitor thread)
+
+class ConnectivityMonitor:
+    def __init__(self, url='https://www.google.com/', timeout=5, poll_interval=1.0, ttl=60) -> None:
+        self.url = url
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.ttl = ttl
+        self.sysfsNetPath = '/sys/class/net'
+
+        self.connected = False
+        self.checkedTime = None  # monotonic time of the last HTTP probe
+        self.linkState = None    # interfaces which have carrier (None if sysfs is not available)
+        self.callbacks = []
 
-def checkWifiConnection(url='https://www.google.com/', timeout=5):
-    try:
-        request = requests.get(url, timeout=timeout)
-        logging.info(f"[INTERNET CONNECTION] Connection valid")
+        self._lock = threading.Lock()
+        self._refreshLock = threading.Lock()
+        self._stopEvent = threading.Event()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopEvent.clear()
+            self._thread = threading.Thread(target=self._run, name='ConnectivityMonitor', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopEvent.set()
+
+    def bind(self, method, *args):
+        self.callbacks.append((method, args))
+
+    def unbind(self, method):
+        self.callbacks = [(m, args) for m, args in self.callbacks if m != method]
+
+    def isConnected(self):
+        return self.connected
+
+    def readLinkState(self):
+        if not os.path.isdir(self.sysfsNetPath):
+            return None
+
+        links = []
+        for iface in sorted(os.listdir(self.sysfsNetPath)):
+            if iface == 'lo':
+                continue
+            try:
+                with open(os.path.join(self.sysfsNetPath, iface, 'operstate'), 'rt') as operstate:
+                    if operstate.read().strip() not in ('up', 'unknown'):
+                        continue
+                with open(os.path.join(self.sysfsNetPath, iface, 'carrier'), 'rt') as carrier:
+                    if carrier.read().strip() != '1':
+                        continue
+            except OSError:
+                continue
+            links.append(iface)
+        return tuple(links)
+
+    def probe(self):
         try:
-            ps = subprocess.Popen(['iwgetid'], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-            output = subprocess.check_output(('grep', 'ESSID'), stdin=ps.stdout)
-            logging.info(f"[INTERNET CONNECTION] WiFi: {output}")
-        except subprocess.CalledProcessError:
-            logging.info(f"[INTERNET CONNECTION] WiFi not detected")
-    except (requests.ConnectionError, requests.Timeout) as exception:
-        logging.info(f"[INTERNET CONNECTION] Connection invalid {exception}")
-        return False
-    return True
+            requests.head(self.url, timeout=self.timeout)
+            logging.info(f"[INTERNET CONNECTION] Connection valid")
+            try:
+                ps = subprocess.Popen(['iwgetid'], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+                output = subprocess.check_output(('grep', 'ESSID'), stdin=ps.stdout)
+                logging.info(f"[INTERNET CONNECTION] WiFi: {output}")
+            except (subprocess.CalledProcessError, OSError):
+                logging.info(f"[INTERNET CONNECTION] WiFi not detected")
+        except (requests.ConnectionError, requests.Timeout) as exception:
+            logging.info(f"[INTERNET CONNECTION] Connection invalid {exception}")
+            return False
+        return True
+
+    def refresh(self, force=False):
+        with self._refreshLock:
+            linkState = self.readLinkState()
+            linkChanged = linkState != self.linkState
+            self.linkState = linkState
+
+            if linkState is not None and len(linkState) == 0:
+                connected = False  # no interface has carrier: offline without sending any request
+                self.checkedTime = time.monotonic()
+            elif force or linkChanged or self.checkedTime is None or time.monotonic() - self.checkedTime > self.ttl:
+                connected = self.probe()
+                self.checkedTime = time.monotonic()
+            else:
+                return self.connected
+
+            self._setConnected(connected)
+            return connected
+
+    def _setConnected(self, connected):
+        if self.connected == connected:
+            return
+        self.connected = connected
+        logging.info(f"[INTERNET CONNECTION] Connection state changed: {'online' if connected else 'offline'}")
+        for method, args in self.callbacks:
+            try:
+                method(connected, *args)
+            except Exception as error:
+                logging.error(f"[INTERNET CONNECTION] Error occurred on calling callback: {error}")
+
+    def _run(self):
+        while not self._stopEvent.is_set():
+            try:
+                self.refresh()
+            except Exception as error:
+                logging.error(f"[INTERNET CONNECTION] Error occurred on monitoring connection: {error}")
+            self._stopEvent.wait(self.poll_interval)
+
+connectivityMonitor = ConnectivityMonitor()
+
+def checkWifiConnection(force=False):
+    if force:
+        return connectivityMonitor.refresh(force=True)
+    return connectivityMonitor.isConnected()
+
+connectivityMonitor.start()
+
+
+# Feature registry
+#
+# Note:
+#   Imports and initializes the features of the device only on first use
+#   Each feature is registered with its loader and the configuration keys that enable it
+#   'getFeature' calls the loader once and returns the cached result after that
+#   (returns None if none of the configuration keys are enabled)
+#   Import and initialization time of each feature is recorded at the startup timeline
+
+class FeatureRegistry:
+    def __init__(self) -> None:
+        self.loaders = {}   # name -> (loader, configuration keys)
+        self.features = {}  # name -> loaded feature
+        self._locks = {}
+
+    def register(self, name, loader, *configKeys):
+        self.loaders[name] = (loader, configKeys)
+        self._locks[name] = threading.Lock()
+
+    def isEnabled(self, name):
+        _, configKeys = self.loaders[name]
+        return len(configKeys) == 0 or any(configurations[key] for key in configKeys)
+
+    def isLoaded(self, name):
+        return name in self.features
+
+    def get(self, name):
+        if name in self.features:
+            return self.features[name]
+        if not self.isEnabled(name):
+            return None
+
+        with self._locks[name]:  # loaders of different features can run at the same time
+            if name not in self.features:
+                loader, _ = self.loaders[name]
+                with startupTimeline.measure(name, 'feature'):
+                    self.features[name] = loader()
+                logging.info(f'[DATA MANAGER] Feature loaded: {name}')
+        return self.features[name]
+
+featureRegistry = FeatureRegistry()
+
+def getFeature(name):
+    return featureRegistry.get(name)
+
+def loadGoogleApi():
+    return types.SimpleNamespace(
+        Request=importModule('google.auth.transport.requests').Request,
+        Credentials=importModule('google.oauth2.credentials').Credentials,
+        InstalledAppFlow=importModule('google_auth_oauthlib.flow').InstalledAppFlow,
+        discovery_cache=importModule('googleapiclient.discovery_cache'),
+        build=importModule('googleapiclient.discovery').build,
+        build_from_document=importModule('googleapiclient.discovery').build_from_document,
+        MediaIoBaseDownload=importModule('googleapiclient.http').MediaIoBaseDownload,
+        MediaIoBaseUpload=importModule('googleapiclient.http').MediaIoBaseUpload,
+        HttpError=importModule('googleapiclient.errors').HttpError,
+        google_auth_httplib2=importModule('google_auth_httplib2'),
+        httplib2=importModule('httplib2'),
+    )
+
+featureRegistry.register('googleApi', loadGoogleApi, 'google-drive-enabled', 'youtube-music-enabled', 'google-assistant-enabled')
+featureRegistry.register('cv2', lambda: importModule('cv2'), 'face-emotion-detection-enabled', 'style-recommendation-enabled')
+featureRegistry.register('bluetooth', lambda: importModule('bluetooth'))
+featureRegistry.register('camera', lambda: importModule('camera_manager').CameraManager.instance(), 'face-emotion-detection-enabled', 'style-recommendation-enabled')
 
 
 # Google login function
@@ -189,7 +485,15 @@ def checkWifiConnection(url='https://www.google.com/', timeout=5):
 # Note:
 #   Function for obtaining OAuth2 credential
 
+oauthLock = threading.Lock()  # only one browser login flow can run at the same time (shares local server port)
+
+def runBrowserFlow(googleApi, clientfile, scopes):
+    with oauthLock:
+        flow = googleApi.InstalledAppFlow.from_client_secrets_file(clientfile, scopes)
+        return flow.run_local_server()
+
 def makeCredentialFromClientfile(clientfile, scopes, savepath, remove_existing_cred=False):
+    googleApi = getFeature('googleApi')
     creds = None
     error_flag = False
 
@@ -201,14 +505,14 @@ def makeCredentialFromClientfile(clientfile, scopes, savepath, remove_existing_c
     if os.path.exists(savepath):
         try:
             logging.info(f'[GOOGLE OAUTH2] Making credentials by using token at {savepath}')
-            creds = Credentials.from_authorized_user_file(savepath, scopes)
+            creds = googleApi.Credentials.from_authorized_user_file(savepath, scopes)
         except:
             error_flag = True
     if error_flag or creds is None or (creds is not None and (not creds.valid or creds.expired)):
         logging.info(f'[GOOGLE OAUTH2] Cannot find token file or error occurred on using token file')
         if creds and creds.expired and creds.refresh_token:
             try:
-                creds.refresh(Request())
+                creds.refresh(googleApi.Request())
             except:
                 logging.error('[GOOGLE OAUTH2] Exception occurred on refreshing token')
                 if os.path.exists(savepath):
@@ -216,12 +520,10 @@ def makeCredentialFromClientfile(clientfile, scopes, savepath, remove_existing_c
                     os.remove(savepath)
 
                 logging.info('[GOOGLE OAUTH2] Generating new token: follow the instruction at the browser')
-                flow = InstalledAppFlow.from_client_secrets_file(clientfile, scopes)
-                creds = flow.run_local_server()
+                creds = runBrowserFlow(googleApi, clientfile, scopes)
         else:
             logging.info(f'[GOOGLE OAUTH2] Generating new token: follow the instruction at the browser')
-            flow = InstalledAppFlow.from_client_secrets_file(clientfile, scopes)
-            creds = flow.run_local_server()
+            creds = runBrowserFlow(googleApi, clientfile, scopes)
 
     with open(savepath, 'w') as savefile:
         logging.info(f'[GOOGLE OAUTH2] Installing generated credentials')
@@ -239,39 +541,68 @@ def makeCredentialFromClientfile(clientfile, scopes, savepath, remove_existing_c
 #   This login process includes user account login and google assistant authentication
 #   (Processed by different browser window) 
 
-# Check Wifi connection
-while not checkWifiConnection():
-    input("Connect to Wifi network and press Enter...")
+def loadGoogleAccount():
+    # Check Wifi connection
+    dataManagerInitListener.wait(['wifiConnection'])
+
+    # User account authentication process
+    creds = None
+    google_scope = []
+    if configurations['google-drive-enabled']:
+        google_scope.append('https://www.googleapis.com/auth/drive.file')
+    if configurations['youtube-music-enabled']:
+        google_scope.append('https://www.googleapis.com/auth/youtube.readonly')
 
-# User account authentication process
-google_scope = []
-if configurations['google-drive-enabled']:
-    google_scope.append('https://www.googleapis.com/auth/drive.file')
-if configurations['youtube-music-enabled']:
-    google_scope.append('https://www.googleapis.com/auth/youtube.readonly')
+    if len(google_scope) != 0:
+        googleclientIDfilename = apikeys['googleclientfilename']
 
-if len(google_scope) != 0:
-    googleclientIDfilename = apikeys['googleclientfilename']
+        if 'user_account_tokens' not in os.listdir('assets'):
+            os.mkdir(os.path.join('assets', 'user_account_tokens'))  # generate user_account_tokens directory
 
-    if 'user_account_tokens' not in os.listdir('assets'):
-        os.mkdir(os.path.join('assets', 'user_account_tokens'))  # generate user_account_tokens directory
+        # Generate login token via web browser
+        tokenpath = os.path.join('assets', 'user_account_tokens', 'token.json')
+        clientSecretPath = os.path.join(os.path.abspath(os.curdir), 'assets', 'keys', googleclientIDfilename)
+        creds = makeCredentialFromClientfile(clientSecretPath, google_scope, tokenpath)
 
-    # Generate login token via web browser
-    tokenpath = os.path.join('assets', 'user_account_tokens', 'token.json')
-    clientSecretPath = os.path.join(os.path.abspath(os.curdir), 'assets', 'keys', googleclientIDfilename)
-    creds = makeCredentialFromClientfile(clientSecretPath, google_scope, tokenpath)
+    return creds
 
-dataManagerInitListener.setInitialized('googleAccountAuth')
+def loadGoogleAssistant():
+    # Check Wifi connection
+    dataManagerInitListener.wait(['wifiConnection'])
 
-# Google assistant authentication process
-if configurations['google-assistant-enabled']:
     # Get authentication via browser if there's no credential file
     credpath = os.path.join(os.path.expanduser('~'), '.config', 'google-oauthlib-tool', 'credentials.json')
     clientSecretPath = os.path.join(os.path.abspath(os.curdir), 'assets', 'keys', apikeys['googleassistantclientfilename'])
     assistant_scope = ['https://www.googleapis.com/auth/assistant-sdk-prototype']
-    assistant_creds = makeCredentialFromClientfile(clientSecretPath, assistant_scope, credpath)
-
-dataManagerInitListener.setInitialized('googleAssistantAuth')
+    makeCredentialFromClientfile(clientSecretPath, assistant_scope, credpath)
+
+    return importModule('pushtotalk_modified')
+
+featureRegistry.register('googleAccount', loadGoogleAccount, 'google-drive-enabled', 'youtube-music-enabled')
+featureRegistry.register('googleAssistant', loadGoogleAssistant, 'google-assistant-enabled')
+
+def waitWifiConnection():
+    # runs on the init thread, so the console is not used (the device may not have any stdin)
+    # keeps waiting while offline so that authentication steps run as soon as the connection is back
+    warnedTime = None
+    while not checkWifiConnection(force=True):
+        if warnedTime is None or time.monotonic() - warnedTime >= configurations['wifi-wait-warning-interval']:
+            logging.warning('[INTERNET CONNECTION] Connect to Wifi network: waiting for internet connection')
+            warnedTime = time.monotonic()
+        time.sleep(5)
+
+# Authentication steps run in background so that UI can be shown before login is done
+# (authentication steps of disabled features are already done)
+dataManagerInitListener.register('wifiConnection', waitWifiConnection)
+if featureRegistry.isEnabled('googleAccount'):
+    dataManagerInitListener.register('googleAccountAuth', lambda: getFeature('googleAccount'), 'readApikey', 'readDeviceConfig', 'wifiConnection')
+else:
+    dataManagerInitListener.setInitialized('googleAccountAuth')
+if featureRegistry.isEnabled('googleAssistant'):
+    dataManagerInitListener.register('googleAssistantAuth', lambda: getFeature('googleAssistant'), 'readApikey', 'readDeviceConfig', 'wifiConnection')
+else:
+    dataManagerInitListener.setInitialized('googleAssistantAuth')
+dataManagerInitListener.start()
 
 
 # Weather data downloader
@@ -320,6 +651,83 @@ class WeatherDownloader:
             return False
 
 
+# Google API service registry
+#
+# Note:
+#   Builds each google API service once per credential and reuses it on every call
+#   Discovery document is parsed only once for each API and version
+#   httplib2 connection is not thread-safe, so each thread gets its own keep-alive connection
+#   Services are kept in thread local storage, so they are released together with their threads
+#   Expired credentials are refreshed before building, and AuthorizedHttp refreshes them on 401 responses
+
+class GoogleServiceRegistry:
+    def __init__(self, timeout=30) -> None:
+        self.timeout = timeout
+        self.local = threading.local()  # services: (api name, version, credential) -> service object of the thread
+        self.documents = {}  # (api name, version) -> parsed discovery document
+        self.buildCount = 0
+        self.hitCount = 0
+        self.documentLoadCount = 0
+        self._lock = threading.Lock()
+
+    def get(self, name, version, credentials):
+        key = (name, version, id(credentials))
+        if not hasattr(self.local, 'services'):
+            self.local.services = {}
+        service = self.local.services.get(key)
+        if service is not None:
+            with self._lock:
+                self.hitCount += 1
+            return service
+
+        googleApi = getFeature('googleApi')
+        self.refreshCredentials(credentials)
+        http = googleApi.google_auth_httplib2.AuthorizedHttp(credentials, http=googleApi.httplib2.Http(timeout=self.timeout))
+        document = self.getDocument(name, version)
+        if document is not None:
+            service = googleApi.build_from_document(document, http=http)
+        else:
+            service = googleApi.build(name, version, http=http, cache_discovery=False)
+
+        self.local.services[key] = service
+        with self._lock:
+            self.buildCount += 1
+        logging.info(f'[GOOGLE API] Built {name} {version} service (builds: {self.buildCount}, cache hits: {self.hitCount})')
+
+        return service
+
+    def getDocument(self, name, version):
+        with self._lock:
+            if (name, version) in self.documents:
+                return self.documents[(name, version)]
+
+        document = getFeature('googleApi').discovery_cache.get_static_doc(name, version)  # discovery document packaged with the library
+        if document is not None:
+            document = json.loads(document)
+
+        with self._lock:
+            self.documents[(name, version)] = document
+            self.documentLoadCount += 1
+        return document
+
+    def refreshCredentials(self, credentials):
+        if credentials is not None and credentials.expired and credentials.refresh_token:
+            try:
+                credentials.refresh(getFeature('googleApi').Request())
+            except Exception as error:
+                logging.error(f'[GOOGLE API] Exception occurred on refreshing token: {error}')
+
+    def report(self):
+        with self._lock:
+            return {
+                'builds': self.buildCount,
+                'hits': self.hitCount,
+                'documentLoads': self.documentLoadCount,
+            }
+
+googleServiceRegistry = GoogleServiceRegistry()
+
+
 # Google drive manager modules
 # 
 # [1] ScheduleDownloader
@@ -352,10 +760,130 @@ styleFileName = 'styles.json'
 driveFolderType = 'application/vnd.google-apps.folder'
 driveTextFileType = 'text/plain'
 
+
+def writeJsonAtomic(path, data):
+    tmpPath = path + '.tmp'
+    with open(tmpPath, 'wt') as tmpFile:
+        tmpFile.write(json.dumps(data, ensure_ascii=False))
+        tmpFile.flush()
+        os.fsync(tmpFile.fileno())
+    os.replace(tmpPath, path)  # readers see either the old file or the new file
+
+
+# Google drive file ID cache
+#
+# Note:
+#   Caches file IDs of google drive paths (e.g. 'Ice Cream Hub/Schedules/2022-06-01.csv')
+#   Cache is saved at 'caches/drive_cache.json' and shared by all google drive modules
+#   Cached IDs are validated lazily: if a request with cached ID fails with 404, path is resolved again
+#   Trashed files still answer requests by ID, so a cached target file is checked with one 'get' before the request
+#   Only MAX_ENTRIES recently used paths are kept (a new schedule file is added every day)
+
+class DriveFileIdCache:
+    MAX_ENTRIES = 64
+
+    def __init__(self, path) -> None:
+        self.path = path
+        self.fileIds = collections.OrderedDict()  # least recently used path first
+        self._lock = threading.Lock()
+
+        try:
+            with open(self.path, 'rt') as cache:
+                self.fileIds.update(json.loads(cache.read()))
+        except Exception as error:
+            logging.info(f'[DRIVE CACHE] Cannot read drive cache: {error}')
+
+    def get(self, path):
+        with self._lock:
+            if path in self.fileIds:
+                self.fileIds.move_to_end(path)
+            return self.fileIds.get(path)
+
+    def set(self, path, fileId):
+        with self._lock:
+            if self.fileIds.get(path) == fileId:
+                return
+            self.fileIds[path] = fileId
+            self.fileIds.move_to_end(path)
+            while len(self.fileIds) > DriveFileIdCache.MAX_ENTRIES:
+                self.fileIds.popitem(last=False)
+            self._save()
+
+    def invalidate(self, path):
+        with self._lock:  # invalidate the path and all of its children
+            for key in [key for key in self.fileIds.keys() if key == path or key.startswith(path + '/')]:
+                del self.fileIds[key]
+            self._save()
+
+    def _save(self):
+        try:
+            writeJsonAtomic(self.path, self.fileIds)
+        except Exception as error:
+            logging.warning(f'[DRIVE CACHE] Cannot write drive cache: {error}')
+
+driveFileIdCache = DriveFileIdCache(os.path.join(os.path.curdir, 'caches', 'drive_cache.json'))
+
+def resolveDrivePath(service, drivePath, create=False):
+    # drivePath: list of (name, mimeType) from application root folder to the target file
+    parentID = None
+    pathKey = ''
+    for name, mimeType in drivePath:
+        pathKey = f'{pathKey}/{name}' if pathKey else name
+        fileID = driveFileIdCache.get(pathKey)
+
+        if fileID is None:
+            query = f"name = '{name}' and trashed = false"
+            if mimeType == driveFolderType:
+                query = f"mimeType = '{driveFolderType}' and " + query
+            if parentID is not None:
+                query += f" and '{parentID}' in parents"
+
+            results = service.files().list(q=query, spaces='drive', fields='nextPageToken, files(id, name)').execute()
+            items = results.get('files', [])
+
+            if items:
+                fileID = items[0]['id']
+            elif create:  # If there's no file, then generate new one
+                body = {'name': name, 'mimeType': mimeType}
+                if parentID is not None:
+                    body['parents'] = [parentID]
+                fileID = service.files().create(body=body, fields='id').execute().get('id')
+            else:
+                return None
+
+            driveFileIdCache.set(pathKey, fileID)
+
+        parentID = fileID
+
+    return parentID
+
+def requestDrivePath(service, drivePath, method, create=False):
+    # Calls method with resolved file ID and resolves the path again if cached file ID is not valid
+    rootKey = drivePath[0][0]
+    targetKey = '/'.join(name for name, mimeType in drivePath)
+    for attempt in range(2):
+        cached = driveFileIdCache.get(targetKey) is not None  # resolved IDs are not trashed (filtered by query)
+        fileID = resolveDrivePath(service, drivePath, create=create)
+        if fileID is None:
+            return None
+
+        try:
+            # trashing a folder also trashes its children, so checking the target file is enough
+            if cached and service.files().get(fileId=fileID, fields='id, trashed').execute().get('trashed', False):
+                logging.info('[DRIVE CACHE] Cached file is trashed: resolving the path again')
+                driveFileIdCache.invalidate(rootKey)
+                continue
+            return method(fileID)
+        except getFeature('googleApi').HttpError as error:
+            if attempt > 0 or error.resp.status != 404:
+                raise
+            logging.info('[DRIVE CACHE] Cached file ID is not valid: resolving the path again')
+            driveFileIdCache.invalidate(rootKey)  # parent folders may also have been removed
+
 class ScheduleDownloader:
-    def __init__(self):
-        global creds
-        self.creds = creds
+    @property
+    def creds(self):
+        return getFeature('googleAccount')
 
     def download(self, targetDate):
         if not configurations['google-drive-enabled']:
@@ -365,186 +893,114 @@ class ScheduleDownloader:
             return []
 
         try:
-            service = build('drive', 'v3', credentials=self.creds)
-
-            # Find out application root folder ID
-            results = service.files().list(
-                q=f"mimeType = '{driveFolderType}' and name = '{rootDirName}' and trashed = false",
-                spaces='drive',
-                fields='nextPageToken, files(id, name)').execute()
-            items = results.get('files', [])
-            if not items:
-                return []
-            rootDirID = items[0]['id']
-
-            # Find out schedule folder
-            results = service.files().list(
-                q=f"mimeType = '{driveFolderType}' and name = '{scheduleDirName}' and trashed = false and '{rootDirID}' in parents",
-                spaces='drive',
-                fields='nextPageToken, files(id, name)').execute()
-            items = results.get('files', [])
-            if not items:
-                return []
-            scheduleDirID = items[0]['id']
-
-            # Find out target file ID
-            results = service.files().list(
-                q=f"name = '{targetDate}.csv' and trashed = false and '{scheduleDirID}' in parents",
-                spaces='drive',
-                fields='nextPageToken, files(id, name)').execute()
-            items = results.get('files', [])
-            if not items:
-                return []
-            targetFileID = items[0]['id']
+            service = googleServiceRegistry.get('drive', 'v3', self.creds)
+
+            def downloadTargetFile(targetFileID):
+                request = service.files().get_media(fileId=targetFileID)
+                fh = io.BytesIO()
+                downloader = getFeature('googleApi').MediaIoBaseDownload(fh, request)
+                done = False
+                while done is False:
+                    status, done = downloader.next_chunk()
+                    logging.info("[SCHEDULE DOWNLOADER] Download %d%%." % int(status.progress() * 100))
+                return fh.getvalue()
 
             # Download target file
-            request = service.files().get_media(fileId=targetFileID)
-            fh = io.BytesIO()
-            downloader = MediaIoBaseDownload(fh, request)
-            done = False
-            while done is False:
-                status, done = downloader.next_chunk()
-                logging.info("[SCHEDULE DOWNLOADER] Download %d%%." % int(status.progress() * 100))
+            drivePath = [(rootDirName, driveFolderType), (scheduleDirName, driveFolderType), (f'{targetDate}.csv', None)]
+            downloaded = requestDrivePath(service, drivePath, downloadTargetFile)
+            if downloaded is None:
+                return []
 
             # Parse downloaded content and return the data
-            content = str(fh.getvalue(), 'utf-8')
+            content = str(downloaded, 'utf-8')
             parsed = []
             for line in content.split('\n'):
                 parsed.append(line.split(','))
 
             return parsed
 
-        except Exception or HttpError as error:
+        except Exception as error:
             logging.error("[SCHEDULE DOWNLOADER] HTTP request error ocurred") 
 
 class SkinConditionUploader:
     def __init__(self):
-        global creds
-        self.creds = creds
+        self.store = SkinConditionStore(os.path.join(os.path.curdir, 'caches', 'skin_conditions.db'))
+        self.flusher = SkinConditionExportFlusher(self.store, self.export)
+        self.flusher.start()
+
+    @property
+    def creds(self):
+        return getFeature('googleAccount')
 
     def upload(self, targetData, targetDate):
-        if not configurations['google-drive-enabled']:
+        # Measurement is saved to the local store and exported later by the background flusher
+        try:
+            self.store.append(targetData, targetDate)
+        except Exception as error:
+            logging.error(f'[SKIN DATA UPLOADER] Cannot save measurement: {error}')
             return False
+
+        if configurations['google-drive-enabled']:
+            self.flusher.notify()
+        return True
+
+    def export(self):
+        # Uploads snapshot of the local store and returns exported revision (None if failed)
+        if not configurations['google-drive-enabled']:
+            return None
         if not checkWifiConnection():
             logging.error(f'[SKIN DATA UPLOADER] Internet connection error')
-            return False
+            return None
 
         try:
-            service = build('drive', 'v3', credentials=self.creds)
-
-            # Find out application root folder ID
-            results = service.files().list(
-                q=f"mimeType = '{driveFolderType}' and name = '{rootDirName}' and trashed = false",
-                spaces='drive',
-                fields='nextPageToken, files(id, name)').execute()
-            items = results.get('files', [])
-            if not items:  # If there's no root dir, then generate new one
-                rootDirFile = service.files().create(body={
-                    'name': rootDirName,
-                    'mimeType': driveFolderType,
-                }, fields='id').execute()
-                rootDirID = rootDirFile.get('id')
-            else:
-                rootDirID = items[0]['id']
-
-            # Find out skin condition folder
-            results = service.files().list(
-                q=f"mimeType = '{driveFolderType}' and name = '{skinConditionDirName}' and trashed = false and '{rootDirID}' in parents",
-                spaces='drive',
-                fields='nextPageToken, files(id, name)').execute()
-            items = results.get('files', [])
-            if not items:  # If there's no skin condition dir, then generate new one
-                skinConditionDirFile = service.files().create(body={
-                    'name': skinConditionDirName,
-                    'mimeType': driveFolderType,
-                    'parents': [rootDirID]
-                }, fields='id').execute()
-                skinConditionDirID = skinConditionDirFile.get('id')
-            else:
-                skinConditionDirID = items[0]['id']
-
-            # Find out target file ID
-            results = service.files().list(
-                q=f"name = '{skinConditionFileName}' and trashed = false and '{skinConditionDirID}' in parents",
-                spaces='drive',
-                fields='nextPageToken, files(id, name)').execute()
-            items = results.get('files', [])
-            if not items:  # If there's no target file, then generate new one
-                targetFile = service.files().create(body={
+            service = googleServiceRegistry.get('drive', 'v3', self.creds)
+
+            def updateTargetFile(targetFileID):
+                # Import data uploaded by previous versions (only once)
+                if not self.store.isSeeded():
+                    request = service.files().get_media(fileId=targetFileID)
+                    fh = io.BytesIO()
+                    downloader = getFeature('googleApi').MediaIoBaseDownload(fh, request)
+                    done = False
+                    while done is False:
+                        status, done = downloader.next_chunk()
+                        logging.info("[SKIN DATA UPLOADER] (current data) Download %d%%." % int(status.progress() * 100))
+
+                    content = str(fh.getvalue(), 'utf-8')
+                    if content:
+                        self.store.merge(json.loads(content))
+                    self.store.setSeeded()
+
+                # Upload snapshot of the local store
+                revision = self.store.revision()
+                content = json.dumps(self.store.export())
+                content_stream = io.BytesIO(bytes(content, 'utf-8'))
+                uploader = getFeature('googleApi').MediaIoBaseUpload(content_stream, mimetype=driveTextFileType)
+                updated_targetFile = service.files().update(fileId=targetFileID, body={
                     'name': skinConditionFileName,
                     'mimeType': driveTextFileType,
-                    'parents': [skinConditionDirID]
-                }, fields='id').execute()
-                targetFileID = targetFile.get('id')
-            else:
-                targetFileID = items[0]['id']
-
-            # Download saved data
-            request = service.files().get_media(fileId=targetFileID)
-            fh = io.BytesIO()
-            downloader = MediaIoBaseDownload(fh, request)
-            done = False
-            while done is False:
-                status, done = downloader.next_chunk()
-                logging.info("[SKIN DATA UPLOADER] (current data) Download %d%%." % int(status.progress() * 100))
-
-            content = str(fh.getvalue(), 'utf-8')
-            if content:
-                parsed = json.loads(content)
-            else:
-                parsed = {
-                    'daily': {},
-                    'monthly': {},
-                }
-
-            # Update daily data
-            if isinstance(targetDate, str):
-                targetDate = datetime.date.fromisoformat(targetDate)
-
-            for key in parsed['daily'].keys():
-                date_key = datetime.date.fromisoformat(key)
-                if targetDate - date_key > datetime.timedelta(30):  # if saved data is expired, delete data
-                    del parsed['daily'][key]
-            
-            if targetDate.isoformat() in parsed.keys():
-                if len(parsed['daily'][targetDate.isoformat()]) >= 10:
-                    del parsed['daily'][targetDate.isoformat()][0]
-                parsed['daily'][targetDate.isoformat()].append(targetData)
-            else:
-                parsed['daily'][targetDate.isoformat()] = [targetData]
-
-            # Update monthly data
-            targetMonthKey = f"{targetDate.year}-{targetDate.month}"
-            if targetMonthKey in parsed['monthly']:
-                if parsed['monthly'][targetMonthKey][1] < 100000:
-                    parsed['monthly'][targetMonthKey][0] += targetData
-                    parsed['monthly'][targetMonthKey][1] += 1
-            else:
-                parsed['monthly'][targetMonthKey] = [targetData, 1]
-            
-            # Upload updated content
-            content = json.dumps(parsed)  # updated content
-            content_stream = io.BytesIO(bytes(content, 'utf-8'))
-            uploader = MediaIoBaseUpload(content_stream, mimetype=driveTextFileType)
-            updated_targetFile = service.files().update(fileId=targetFileID, body={
-                'name': skinConditionFileName,
-                'mimeType': driveTextFileType,
-            }, media_body=uploader, fields='id').execute()
-
-            if not updated_targetFile.get('id'):
-                raise Exception('Updated target file id is not identified')
+                }, media_body=uploader, fields='id').execute()
 
-            return True
+                if not updated_targetFile.get('id'):
+                    raise Exception('Updated target file id is not identified')
+                return revision
+
+            drivePath = [(rootDirName, driveFolderType), (skinConditionDirName, driveFolderType), (skinConditionFileName, driveTextFileType)]
+            revision = requestDrivePath(service, drivePath, updateTargetFile, create=True)
 
-        except Exception or HttpError as error:
+            logging.info(f'[SKIN DATA UPLOADER] Exported skin conditions (revision {revision})')
+            return revision
+
+        except Exception as error:
             logging.error(f"[SKIN CONDITION UPLOADER] HTTP request error ocurred: {error}")
         
-        return False
+        return None
+
 
 class StyleUploader:
-    def __init__(self):
-        global creds
-        self.creds = creds
+    @property
+    def creds(self):
+        return getFeature('googleAccount')
 
     def upload(self, targetData):
         if not configurations['google-drive-enabled']:
@@ -554,81 +1010,278 @@ class StyleUploader:
             return False
 
         try:
-            service = build('drive', 'v3', credentials=self.creds)
-
-            # Find out application root folder ID
-            results = service.files().list(
-                q=f"mimeType = '{driveFolderType}' and name = '{rootDirName}' and trashed = false",
-                spaces='drive',
-                fields='nextPageToken, files(id, name)').execute()
-            items = results.get('files', [])
-            if not items:  # If there's no root dir, then generate new one
-                rootDirFile = service.files().create(body={
-                    'name': rootDirName,
-                    'mimeType': driveFolderType,
-                }, fields='id').execute()
-                rootDirID = rootDirFile.get('id')
-            else:
-                rootDirID = items[0]['id']
-
-            # Find out skin condition folder
-            results = service.files().list(
-                q=f"mimeType = '{driveFolderType}' and name = '{styleDirName}' and trashed = false and '{rootDirID}' in parents",
-                spaces='drive',
-                fields='nextPageToken, files(id, name)').execute()
-            items = results.get('files', [])
-            if not items:  # If there's no skin condition dir, then generate new one
-                styleDirFile = service.files().create(body={
-                    'name': styleDirName,
-                    'mimeType': driveFolderType,
-                    'parents': [rootDirID]
-                }, fields='id').execute()
-                styleDirID = styleDirFile.get('id')
-            else:
-                styleDirID = items[0]['id']
-
-            # Find out target file ID
-            results = service.files().list(
-                q=f"name = '{styleFileName}' and trashed = false and '{styleDirID}' in parents",
-                spaces='drive',
-                fields='nextPageToken, files(id, name)').execute()
-            items = results.get('files', [])
-            if not items:  # If there's no target file, then generate new one
-                targetFile = service.files().create(body={
-                    'name': styleFileName,
-                    'mimeType': driveTextFileType,
-                    'parents': [styleDirID]
-                }, fields='id').execute()
-                targetFileID = targetFile.get('id')
-            else:
-                targetFileID = items[0]['id']
+            service = googleServiceRegistry.get('drive', 'v3', self.creds)
 
-            # Download saved data
+            # Data to upload
             parsed = {
                 'date': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
                 'body': targetData
             }
 
+            def updateTargetFile(targetFileID):
+                content = json.dumps(parsed)  # updated content
+                content_stream = io.BytesIO(bytes(content, 'utf-8'))
+                uploader = getFeature('googleApi').MediaIoBaseUpload(content_stream, mimetype=driveTextFileType)
+                return service.files().update(fileId=targetFileID, body={
+                    'name': styleFileName,
+                    'mimeType': driveTextFileType,
+                }, media_body=uploader, fields='id').execute()
+
             # Upload updated content
-            content = json.dumps(parsed)  # updated content
-            content_stream = io.BytesIO(bytes(content, 'utf-8'))
-            uploader = MediaIoBaseUpload(content_stream, mimetype=driveTextFileType)
-            updated_targetFile = service.files().update(fileId=targetFileID, body={
-                'name': styleFileName,
-                'mimeType': driveTextFileType,
-            }, media_body=uploader, fields='id').execute()
-
-            if not updated_targetFile.get('id'):
+            drivePath = [(rootDirName, driveFolderType), (styleDirName, driveFolderType), (styleFileName, driveTextFileType)]
+            updated_targetFile = requestDrivePath(service, drivePath, updateTargetFile, create=True)
+
+            if not updated_targetFile or not updated_targetFile.get('id'):
                 raise Exception('Updated target file id is not identified')
 
             return True
 
-        except Exception or HttpError as error:
+        except Exception as error:
             logging.error(f"[STYLE DATA UPLOADER] HTTP request error ocurred: {error}")
 
         return False
 
 
+# Skin condition store
+#
+# Note:
+#   Local time-series store of skin condition measurements (source of truth of the skin condition data)
+#   Saved as SQLite database at 'caches/skin_conditions.db'
+#   Each day keeps a ring buffer of the latest 10 measurements with running sum and count
+#   Each month keeps running sum and count, so daily and monthly aggregates are O(1)
+#   Google drive file is only an export target of this store (see 'export' method)
+
+class SkinConditionStore:
+    DAILY_SLOTS = 10        # number of measurements kept for each day
+    RETENTION_DAYS = 30     # daily data older than this is removed
+    MONTHLY_LIMIT = 100000  # monthly aggregate stops counting after this number of measurements
+
+    def __init__(self, path) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS daily_slots (day TEXT, slot INTEGER, value REAL, PRIMARY KEY (day, slot));
+            CREATE TABLE IF NOT EXISTS daily_stats (day TEXT PRIMARY KEY, written INTEGER, total REAL, count INTEGER);
+            CREATE TABLE IF NOT EXISTS monthly_stats (month TEXT PRIMARY KEY, total REAL, count INTEGER);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        ''')
+        self._conn.commit()
+
+    def append(self, value, targetDate):
+        if isinstance(targetDate, str):
+            targetDate = datetime.date.fromisoformat(targetDate)
+        month = f"{targetDate.year}-{targetDate.month}"
+
+        with self._lock, self._conn:
+            self._appendDaily(value, targetDate)
+            self._conn.execute('''
+                INSERT INTO monthly_stats VALUES (?, ?, 1) ON CONFLICT(month) DO UPDATE SET
+                total = total + ?, count = count + 1 WHERE count < ?
+            ''', (month, value, value, SkinConditionStore.MONTHLY_LIMIT))
+            self._setMeta('revision', self._getMeta('revision', 0) + 1)
+
+    def lastDays(self, days=30, today=None):
+        # returns {date: [measurements (oldest first)]} of the last given days
+        today = today if today is not None else datetime.date.today()
+        since = (today - datetime.timedelta(days - 1)).isoformat()
+
+        result = {}
+        with self._lock:
+            stats = self._conn.execute('SELECT day, written FROM daily_stats WHERE day >= ? ORDER BY day', (since,)).fetchall()
+            for day, written in stats:
+                result[day] = self._readDaily(day, written)
+        return result
+
+    def dailyMeans(self, days=30, today=None):
+        today = today if today is not None else datetime.date.today()
+        since = (today - datetime.timedelta(days - 1)).isoformat()
+        with self._lock:
+            rows = self._conn.execute('SELECT day, total, count FROM daily_stats WHERE day >= ? ORDER BY day', (since,)).fetchall()
+        return {day: total / count for day, total, count in rows if count > 0}
+
+    def monthlyMean(self, year, month):
+        with self._lock:
+            row = self._conn.execute('SELECT total, count FROM monthly_stats WHERE month = ?', (f"{year}-{month}",)).fetchone()
+        if row is None or row[1] == 0:
+            return None
+        return row[0] / row[1]
+
+    def trend(self, days=30, today=None):
+        # slope of daily means (change of skin condition per day) calculated by least squares
+        today = today if today is not None else datetime.date.today()
+        points = [((datetime.date.fromisoformat(day) - today).days, mean) for day, mean in self.dailyMeans(days, today).items()]
+        if len(points) < 2:
+            return None
+
+        meanX = sum(x for x, _ in points) / len(points)
+        meanY = sum(y for _, y in points) / len(points)
+        varX = sum((x - meanX) ** 2 for x, _ in points)
+        if varX == 0:
+            return None
+        return sum((x - meanX) * (y - meanY) for x, y in points) / varX
+
+    def export(self, today=None):
+        # returns data in the format of 'skinconditions.json' of google drive
+        with self._lock:
+            monthly = {month: [total, count] for month, total, count in self._conn.execute('SELECT month, total, count FROM monthly_stats')}
+        return {
+            'daily': self.lastDays(SkinConditionStore.RETENTION_DAYS + 1, today),
+            'monthly': monthly,
+        }
+
+    def merge(self, parsed):
+        # imports data uploaded by previous versions ('skinconditions.json' of google drive)
+        # (imported data and local data are disjoint, so monthly aggregates are summed up)
+        with self._lock, self._conn:
+            for day, values in sorted(parsed.get('daily', {}).items()):
+                self._mergeDaily(values, datetime.date.fromisoformat(day))
+            for month, (total, count) in parsed.get('monthly', {}).items():
+                row = self._conn.execute('SELECT total, count FROM monthly_stats WHERE month = ?', (month,)).fetchone()
+                if row is not None:
+                    total, count = total + row[0], count + row[1]
+                if count > SkinConditionStore.MONTHLY_LIMIT:  # same limit as 'append' (mean is kept)
+                    total, count = total * SkinConditionStore.MONTHLY_LIMIT / count, SkinConditionStore.MONTHLY_LIMIT
+                self._conn.execute('INSERT OR REPLACE INTO monthly_stats VALUES (?, ?, ?)', (month, total, count))
+            self._setMeta('revision', self._getMeta('revision', 0) + 1)
+
+    def revision(self):
+        with self._lock:
+            return self._getMeta('revision', 0)
+
+    def exportedRevision(self):
+        with self._lock:
+            return self._getMeta('exportedRevision', 0)
+
+    def setExported(self, revision):
+        with self._lock, self._conn:
+            self._setMeta('exportedRevision', revision)
+
+    def isSeeded(self):
+        with self._lock:
+            return self._getMeta('seeded', 0) == 1
+
+    def setSeeded(self):
+        with self._lock, self._conn:
+            self._setMeta('seeded', 1)
+
+    def _appendDaily(self, value, targetDate):
+        day = targetDate.isoformat()
+        expired = (targetDate - datetime.timedelta(SkinConditionStore.RETENTION_DAYS)).isoformat()
+
+        # Update ring buffer of the day (overwrite the oldest slot if the buffer is full)
+        row = self._conn.execute('SELECT written FROM daily_stats WHERE day = ?', (day,)).fetchone()
+        written = row[0] if row is not None else 0
+        slot = written % SkinConditionStore.DAILY_SLOTS
+        old = self._conn.execute('SELECT value FROM daily_slots WHERE day = ? AND slot = ?', (day, slot)).fetchone()
+        self._conn.execute('INSERT OR REPLACE INTO daily_slots VALUES (?, ?, ?)', (day, slot, value))
+        self._conn.execute('''
+            INSERT INTO daily_stats VALUES (?, 1, ?, 1) ON CONFLICT(day) DO UPDATE SET
+            written = written + 1, total = total + ? - ?, count = MIN(count + 1, ?)
+        ''', (day, value, value, old[0] if old is not None else 0, SkinConditionStore.DAILY_SLOTS))
+
+        # Remove expired daily data
+        self._conn.execute('DELETE FROM daily_slots WHERE day < ?', (expired,))
+        self._conn.execute('DELETE FROM daily_stats WHERE day < ?', (expired,))
+
+    def _mergeDaily(self, values, targetDate):
+        # imported values were measured before the local values of the day (uploaded by previous versions)
+        day = targetDate.isoformat()
+        expired = (targetDate - datetime.timedelta(SkinConditionStore.RETENTION_DAYS)).isoformat()
+
+        row = self._conn.execute('SELECT written FROM daily_stats WHERE day = ?', (day,)).fetchone()
+        local = self._readDaily(day, row[0]) if row is not None else []
+        merged = (list(values) + local)[-SkinConditionStore.DAILY_SLOTS:]
+
+        # Rewrite ring buffer of the day in measured order
+        self._conn.execute('DELETE FROM daily_slots WHERE day = ?', (day,))
+        self._conn.executemany('INSERT INTO daily_slots VALUES (?, ?, ?)', [(day, slot, value) for slot, value in enumerate(merged)])
+        self._conn.execute('INSERT OR REPLACE INTO daily_stats VALUES (?, ?, ?, ?)', (day, len(merged), sum(merged), len(merged)))
+
+        # Remove expired daily data
+        self._conn.execute('DELETE FROM daily_slots WHERE day < ?', (expired,))
+        self._conn.execute('DELETE FROM daily_stats WHERE day < ?', (expired,))
+
+    def _readDaily(self, day, written):
+        # returns measurements of the day in the ring buffer (oldest first)
+        slots = dict(self._conn.execute('SELECT slot, value FROM daily_slots WHERE day = ?', (day,)).fetchall())
+        count = min(written, SkinConditionStore.DAILY_SLOTS)
+        return [slots[idx % SkinConditionStore.DAILY_SLOTS] for idx in range(written - count, written)]
+
+    def _getMeta(self, key, default=None):
+        row = self._conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row is not None else default
+
+    def _setMeta(self, key, value):
+        self._conn.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', (key, json.dumps(value)))
+
+
+# Skin condition export flusher
+#
+# Note:
+#   Background thread that exports the skin condition store to google drive when it has new data
+#   Measurements added while exporting are coalesced into the next single export
+#   Failed exports (e.g. no internet connection) are retried with exponential backoff
+
+class SkinConditionExportFlusher:
+    def __init__(self, store, method, min_backoff=5, max_backoff=600) -> None:
+        self.store = store
+        self.method = method  # export method: returns exported revision, None if failed
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.backoff = min_backoff
+
+        self._lock = threading.Lock()
+        self._wakeEvent = threading.Event()
+        self._thread = None
+
+        connectivityMonitor.bind(self.acceptConnectivity)
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='SkinConditionExportFlusher', daemon=True)
+            self._thread.start()
+        self._wakeEvent.set()  # export data left by the previous run
+
+    def notify(self):
+        self._wakeEvent.set()
+
+    def isDirty(self):
+        return self.store.revision() > self.store.exportedRevision()
+
+    def acceptConnectivity(self, connected):
+        if connected:
+            self.backoff = self.min_backoff
+            self._wakeEvent.set()
+
+    def _run(self):
+        timeout = None
+        while True:
+            self._wakeEvent.wait(timeout)
+            self._wakeEvent.clear()
+
+            if not self.isDirty():
+                timeout = None
+                continue
+
+            try:
+                revision = self.method()
+            except Exception as error:
+                logging.error(f'[SKIN DATA UPLOADER] Error occurred on exporting skin conditions: {error}')
+                revision = None
+
+            if revision is not None:
+                self.store.setExported(revision)
+                self.backoff = self.min_backoff
+                timeout = 0 if self.isDirty() else None
+            else:
+                logging.info(f'[SKIN DATA UPLOADER] Export is pending: retry after {self.backoff} seconds')
+                timeout = self.backoff
+                self.backoff = min(self.backoff * 2, self.max_backoff)
+
+
 # Bluetooth controlller
 #
 # Note:
@@ -639,6 +1292,7 @@ class StyleUploader:
 
 class BluetoothController:
     def __init__(self):
+        bluetooth = getFeature('bluetooth')
         self.server_sock = bluetooth.BluetoothSocket(bluetooth.RFCOMM)
         self.server_sock.bind(('', bluetooth.PORT_ANY))
         self.server_sock.listen(1)
@@ -746,12 +1400,6 @@ def weekDay(year, month, day):
 #   Note that this modified pushtotalk.py is licenced by Google and cannot be used in
 #   commercial purpose.
 
-google_assistant_activate = lambda: None
-
-if configurations['google-assistant-enabled']:
-    import pushtotalk_modified as pushtotalk
-    google_assistant_activate = pushtotalk.main
-
 class AssistantListener(object):
     def __init__(self) -> None:
         self.msg = None
@@ -773,58 +1421,566 @@ class AssistantListener(object):
     def bind(self, callback):
         self.observers.append(callback)
 
+# Assistant trigger
+#
+# Note:
+#   Wakes the assistant thread up when the assistant is triggered (GPIO button, bluetooth token, Qt button)
+#   'trigger' can be called from any thread; triggers are coalesced until the waiter consumes them
+#   'wait' blocks until triggered and returns False on timeout or cancellation
+#   Latency from trigger to the start of recording is measured with 'markRecording'
+
 class AssistantTrigger:
-    def __init__(self) -> None:
+    def __init__(self, maxRecords=50) -> None:
         self.flag = False
-    
+        self.cancelled = False
+        self.triggeredTime = None
+        self.latencies = collections.deque(maxlen=maxRecords)  # trigger to recording latencies (ms)
+        self._condition = threading.Condition()
+
     def istriggered(self):
-        if self.flag:
+        with self._condition:
+            return self._consume()
+
+    def trigger(self):
+        with self._condition:
+            if not self.flag:
+                self.triggeredTime = time.perf_counter()
+            self.flag = True
+            self._condition.notify_all()
+
+    def wait(self, timeout=None):
+        with self._condition:
+            self._condition.wait_for(lambda: self.flag or self.cancelled, timeout)
+            return self._consume()
+
+    def cancel(self):
+        with self._condition:
+            self.cancelled = True
+            self._condition.notify_all()
+
+    def markRecording(self):
+        with self._condition:
+            if self.triggeredTime is None:
+                return None
+            latency = (time.perf_counter() - self.triggeredTime) * 1000
+            self.triggeredTime = None
+            self.latencies.append(latency)
+        logging.debug(f'[ASSISTANT] Trigger to recording latency: {latency:.1f}ms')
+        return latency
+
+    def averageLatency(self):
+        with self._condition:
+            if len(self.latencies) == 0:
+                return None
+            return sum(self.latencies) / len(self.latencies)
+
+    def _consume(self):
+        if self.flag and not self.cancelled:
             self.flag = False
             return True
         return False
 
-    def trigger(self):
-        self.flag = True
-
 class AssistantManager:
     def __init__(self) -> None:
         self.assistantListener = AssistantListener()
         self.assistantTrigger = AssistantTrigger()
-        pushtotalk.assistant_trigger = self.assistantTrigger
 
     def activate(self, callback):
         if configurations['google-assistant-enabled']:
+            pushtotalk = getFeature('googleAssistant')
+            pushtotalk.assistant_trigger = self.assistantTrigger
             self.assistantListener.initialize()
             pushtotalk.message_listener = self.assistantListener
             self.assistantListener.bind(callback)
-            google_assistant_activate()
+            pushtotalk.main()
 
 
 # YouTube music manager
 #
 # Note:
 #   Plays a music from youtube metadata and vlc player
+#   Tracks are played by vlc media list player: up to 'youtube-queue-window' resolved tracks are
+#   queued after the playing track by the queue thread, so the next track starts without a gap
+#   Next page of the search result is requested in background before the queue runs dry
 
 cachesDirectoryPath = os.path.join(os.path.curdir, 'caches')
-faceEmotionDetectModule = None
-
-if "youtubeapikey" in apikeys.keys():
-    pafy.set_api_key(apikeys["youtubeapikey"])
 
-if configurations['face-emotion-detection-enabled']:
-    faceEmotionDetectModule = face_emotion_detection.MirrorFaceDetect(face_apikey=apikeys['azureface'], face_api_endpoint=apikeys['azureface-endpoint'])
+def loadYouTubeMusic():
+    pafy = importModule('pafy')
+    if "youtubeapikey" in apikeys.keys():
+        pafy.set_api_key(apikeys["youtubeapikey"])
+    return types.SimpleNamespace(pafy=pafy, vlc=importModule('vlc'))
+
+def loadFaceEmotionDetector():
+    face_emotion_detection = getFeature('faceEmotion')
+    face_emotion_detection.face_detector.configure(backend=configurations['face-detector-backend'],
+                                                   target=configurations['face-detector-target'])
+    threading.Thread(target=face_emotion_detection.face_detector.warm_up, daemon=True).start()  # loads the model while camera starts
+    return face_emotion_detection.MirrorFaceDetect(face_apikey=apikeys.get('azureface'), face_api_endpoint=apikeys.get('azureface-endpoint'),
+                                                   jpeg_quality=configurations['face-api-jpeg-quality'],
+                                                   max_width=configurations['face-api-max-width'],
+                                                   backend=configurations['face-emotion-backend'],
+                                                   model_path=configurations['face-emotion-model'])
+
+featureRegistry.register('youtubeMusic', loadYouTubeMusic, 'youtube-music-enabled')
+featureRegistry.register('faceEmotion', lambda: importModule('face_emotion_detection'), 'face-emotion-detection-enabled')
+featureRegistry.register('faceEmotionDetector', loadFaceEmotionDetector, 'face-emotion-detection-enabled')
+
+youtubeCacheLock = threading.RLock()
 
 def readYouTubeCaches():
-    with open(os.path.join(cachesDirectoryPath, 'youtube_cache.json'), 'r') as cache:
-        cached_data = json.loads(cache.read())
+    with youtubeCacheLock:
+        with open(os.path.join(cachesDirectoryPath, 'youtube_cache.json'), 'r') as cache:
+            cached_data = json.loads(cache.read())
     return cached_data
 
-def writeYouTubeCaches(playlist, query):
-    with open(os.path.join(cachesDirectoryPath, 'youtube_cache.json'), 'wt') as cache:
-        cache.write(json.dumps({
-            'playlist': playlist,
-            'query': query,
-        }))
+def writeYouTubeCaches(**updates):
+    with youtubeCacheLock:
+        try:
+            cached_data = readYouTubeCaches()
+        except Exception:
+            cached_data = {}
+
+        cached_data.update(updates)
+        writeJsonAtomic(os.path.join(cachesDirectoryPath, 'youtube_cache.json'), cached_data)
+
+def compactTrack(item):
+    # only the fields used by the player are kept from the search result item
+    return {'videoId': item['id']['videoId'], 'title': item['snippet']['title'], 'duration': None}
+
+def parseIsoDuration(duration):
+    # ISO 8601 duration of youtube data api (e.g. PT1H2M3S, P1DT2S)
+    match = re.fullmatch(r'P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?', duration)
+    if match is None:
+        return None
+    days, hours, minutes, seconds = (int(value) if value else 0 for value in match.groups())
+    return ((days * 24 + hours) * 60 + minutes) * 60 + seconds
+
+
+# YouTube playlist store
+#
+# Note:
+#   Keeps playlists of searched queries with the fields used by the player (videoId, title, duration)
+#   youtube_cache.json is the index: active query and page token chain of each stored playlist
+#   Each playlist is a JSON lines file at 'caches/youtube_playlists' (one line per search result page)
+#     * new playlist: written to temporary file and replaced atomically
+#     * next page: appended as a new line (incomplete last line is ignored on loading)
+#   Only the active playlist is read at startup
+#   Least recently updated playlists are removed when more than MAX_PLAYLISTS are stored
+
+class YouTubePlaylistStore:
+    MAX_PLAYLISTS = 20
+
+    def __init__(self, directory) -> None:
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._migrate()
+
+    def playlistPath(self, query):
+        return os.path.join(self.directory, hashlib.sha1(query.encode('utf-8')).hexdigest()[:16] + '.jsonl')
+
+    def loadActive(self):
+        try:
+            query = readYouTubeCaches().get('active')
+        except Exception:
+            return None, [], None
+        if query is None:
+            return None, [], None
+        tracks, nextPageToken = self.load(query)
+        return query, tracks, nextPageToken
+
+    def load(self, query):
+        tracks, nextPageToken = [], None
+        with open(self.playlistPath(query), 'rt') as playlistFile:
+            for line in playlistFile:
+                try:
+                    page = json.loads(line)
+                except ValueError:
+                    continue  # incomplete page (interrupted while appending)
+                tracks += page['tracks']
+                nextPageToken = page['nextPageToken']
+        return tracks, nextPageToken
+
+    def save(self, query, tracks, nextPageToken):
+        page = {'pageToken': None, 'nextPageToken': nextPageToken, 'tracks': tracks}
+        with self._lock:
+            path = self.playlistPath(query)
+            with open(path + '.tmp', 'wt') as tmpFile:
+                tmpFile.write(json.dumps(page, ensure_ascii=False) + '\n')
+                tmpFile.flush()
+                os.fsync(tmpFile.fileno())
+            os.replace(path + '.tmp', path)
+            self._updateIndex(query, [None], nextPageToken, len(tracks))
+
+    def append(self, query, pageToken, tracks, nextPageToken):
+        page = {'pageToken': pageToken, 'nextPageToken': nextPageToken, 'tracks': tracks}
+        with self._lock:
+            with open(self.playlistPath(query), 'ab+') as playlistFile:
+                playlistFile.seek(0, os.SEEK_END)
+                if playlistFile.tell() > 0:
+                    playlistFile.seek(-1, os.SEEK_END)
+                    if playlistFile.read(1) != b'\n':
+                        playlistFile.write(b'\n')  # keep new page apart from the incomplete line
+                playlistFile.write((json.dumps(page, ensure_ascii=False) + '\n').encode('utf-8'))
+            entry = readYouTubeCaches().get('playlists', {}).get(query, {})
+            self._updateIndex(query, entry.get('pageTokens', []) + [pageToken], nextPageToken, entry.get('count', 0) + len(tracks))
+
+    def _updateIndex(self, query, pageTokens, nextPageToken, count):
+        with youtubeCacheLock:
+            try:
+                playlists = readYouTubeCaches().get('playlists', {})
+            except Exception:
+                playlists = {}
+            playlists[query] = {'pageTokens': pageTokens, 'nextPageToken': nextPageToken, 'count': count, 'updated': time.time()}
+
+            for oldQuery in sorted(playlists, key=lambda key: playlists[key]['updated'])[:-YouTubePlaylistStore.MAX_PLAYLISTS]:
+                del playlists[oldQuery]
+                if os.path.exists(self.playlistPath(oldQuery)):
+                    os.remove(self.playlistPath(oldQuery))
+
+            writeYouTubeCaches(active=query, playlists=playlists)
+
+    def _migrate(self):
+        # youtube_cache.json of the previous version keeps the whole search result items of one playlist
+        with youtubeCacheLock:
+            try:
+                cached_data = readYouTubeCaches()
+            except Exception:
+                return
+            if 'playlist' not in cached_data:
+                return
+            try:
+                self.save(cached_data['query'], [compactTrack(item) for item in cached_data['playlist']], None)
+                logging.info('[YOUTUBE MUSIC] Youtube cache is migrated to the playlist store')
+            except Exception as error:
+                logging.warning(f'[YOUTUBE MUSIC] Cannot migrate youtube caches {error}')
+            cached_data = readYouTubeCaches()
+            cached_data.pop('playlist', None)
+            cached_data.pop('query', None)
+            writeJsonAtomic(os.path.join(cachesDirectoryPath, 'youtube_cache.json'), cached_data)
+
+
+# YouTube search cache
+#
+# Note:
+#   Keeps results of recent searches at 'caches/youtube_searches' (one JSON file per result)
+#   Results are keyed by query, region code, video category and page token
+#   Results expire after 'youtube-search-cache-ttl' seconds and the least recently used results
+#   are evicted when more than 'youtube-search-cache-size' results are stored
+#   Only file names are listed at startup: a result is read when it is requested
+
+class YouTubeSearchCache:
+    def __init__(self, directory, ttl, capacity) -> None:
+        self.directory = directory
+        self.ttl = ttl
+        self.capacity = capacity
+        self.entries = collections.OrderedDict()  # file name -> None (least recently used first)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        try:
+            files = [entry for entry in os.scandir(directory) if entry.name.endswith('.json')]
+            for entry in sorted(files, key=lambda entry: entry.stat().st_mtime):
+                self.entries[entry.name] = None
+        except Exception as error:
+            logging.warning(f'[YOUTUBE MUSIC] Cannot read youtube search caches {error}')
+        while len(self.entries) > self.capacity:  # capacity can be lowered in config.json
+            self._remove(next(iter(self.entries)))
+        self._migrate()
+
+    @staticmethod
+    def makeKey(query, regionCode, categoryId, pageToken=None):
+        return json.dumps([query, regionCode, categoryId, pageToken], ensure_ascii=False)
+
+    @staticmethod
+    def makeFilename(key):
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()[:16] + '.json'
+
+    def get(self, query, regionCode, categoryId, pageToken=None):
+        key = YouTubeSearchCache.makeKey(query, regionCode, categoryId, pageToken)
+        filename = YouTubeSearchCache.makeFilename(key)
+        with self._lock:
+            entry = None
+            if filename in self.entries:
+                try:
+                    with open(os.path.join(self.directory, filename), 'rt') as cacheFile:
+                        entry = json.loads(cacheFile.read())
+                except Exception:
+                    entry = None
+                if entry is None or entry['key'] != key or time.time() - entry['time'] > self.ttl:
+                    self._remove(filename)
+                    entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(filename)
+            os.utime(os.path.join(self.directory, filename))  # keeps the order after restart
+            self.hits += 1
+            return entry['result']
+
+    def set(self, query, regionCode, categoryId, result, pageToken=None):
+        key = YouTubeSearchCache.makeKey(query, regionCode, categoryId, pageToken)
+        filename = YouTubeSearchCache.makeFilename(key)
+        entry = {
+            'key': key,
+            'time': time.time(),
+            'result': {'items': result['items'], 'nextPageToken': result.get('nextPageToken')},
+        }
+        with self._lock:
+            writeJsonAtomic(os.path.join(self.directory, filename), entry)
+            self.entries[filename] = None
+            self.entries.move_to_end(filename)
+            while len(self.entries) > self.capacity:
+                self._remove(next(iter(self.entries)))
+
+    def _remove(self, filename):
+        self.entries.pop(filename, None)
+        try:
+            os.remove(os.path.join(self.directory, filename))
+        except FileNotFoundError:
+            pass
+
+    def _migrate(self):
+        # search results of the previous version are kept at 'searches' of youtube_cache.json
+        with youtubeCacheLock:
+            try:
+                cached_data = readYouTubeCaches()
+            except Exception:
+                return
+            if cached_data.pop('searches', None) is None:
+                return
+            writeJsonAtomic(os.path.join(cachesDirectoryPath, 'youtube_cache.json'), cached_data)
+
+
+# Audio cache
+#
+# Note:
+#   Keeps audio of played tracks at 'caches/audio' (disabled unless 'youtube-audio-cache-mb' is set)
+#   Audio is downloaded in background while the track is played by vlc
+#   Least recently played files are removed when the cache exceeds its size limit
+
+class AudioCache:
+    def __init__(self, directory, limitBytes) -> None:
+        self.directory = directory
+        self.limitBytes = limitBytes
+        self.files = {}  # videoId -> file path
+        self.pending = collections.deque()
+        self._condition = threading.Condition()
+
+        if not self.isEnabled():
+            return
+
+        os.makedirs(directory, exist_ok=True)
+        for filename in os.listdir(directory):
+            if filename.endswith('.part'):
+                os.remove(os.path.join(directory, filename))  # interrupted download
+            else:
+                self.files[os.path.splitext(filename)[0]] = os.path.join(directory, filename)
+        threading.Thread(target=self._run, name='audio-cache', daemon=True).start()
+
+    def isEnabled(self):
+        return self.limitBytes > 0
+
+    def get(self, videoId):
+        with self._condition:
+            path = self.files.get(videoId)
+        if path is None or not os.path.exists(path):
+            return None
+        os.utime(path)  # modified time is used as the last played time
+        return path
+
+    def fill(self, videoId, url):
+        if not self.isEnabled() or url is None:
+            return
+        with self._condition:
+            if videoId in self.files or any(videoId == pendingId for pendingId, _ in self.pending):
+                return
+            self.pending.append((videoId, url))
+            self._condition.notify_all()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: len(self.pending) > 0)
+                videoId, url = self.pending.popleft()
+            try:
+                self._download(videoId, url)
+            except Exception as error:
+                logging.warning(f'[AUDIO CACHE] Cannot cache audio of {videoId}: {error}')
+
+    def _download(self, videoId, url):
+        path = os.path.join(self.directory, f'{videoId}.audio')
+        size = 0
+        try:
+            with requests.get(url, stream=True, timeout=10) as response:
+                response.raise_for_status()
+                with open(path + '.part', 'wb') as audioFile:
+                    for chunk in response.iter_content(chunk_size=64 * 1024):
+                        size += len(chunk)
+                        if size > self.limitBytes:
+                            raise ValueError('audio is larger than the cache')
+                        audioFile.write(chunk)
+            os.replace(path + '.part', path)
+        finally:
+            if os.path.exists(path + '.part'):
+                os.remove(path + '.part')
+
+        with self._condition:
+            self.files[videoId] = path
+        logging.info(f'[AUDIO CACHE] Cached audio of {videoId} ({size / 1024 / 1024:.1f}MB)')
+        self._evict()
+
+    def _evict(self):
+        with self._condition:
+            entries = []
+            for videoId, path in self.files.items():
+                try:
+                    stat = os.stat(path)
+                    entries.append((stat.st_mtime, stat.st_size, videoId, path))
+                except OSError:
+                    entries.append((0, 0, videoId, path))
+
+            total = sum(entry[1] for entry in entries)
+            for _, size, videoId, path in sorted(entries):
+                if total <= self.limitBytes:
+                    break
+                del self.files[videoId]
+                if os.path.exists(path):
+                    os.remove(path)
+                total -= size
+                logging.info(f'[AUDIO CACHE] Removed audio of {videoId}')
+
+
+# Stream resolver
+#
+# Note:
+#   Resolves stream url of youtube videos (pafy) and makes vlc media objects ahead of time
+#   'prefetch' queues videos to be resolved by the background thread (ex. next and previous tracks)
+#   'get' returns ready media object of the video (resolves on the caller's thread if not prefetched)
+#   Stream urls expire (see 'expire' parameter of the url), so expired entries are resolved again
+#   Tracks in the audio cache are played from the local file
+#   Only 'capacity' recently used entries are kept; expired and evicted media objects are released
+#   (media list of the player keeps its own reference of the queued media)
+
+class StreamResolver:
+    def __init__(self, instance, audioCache=None, margin=60, defaultTtl=3600, capacity=8) -> None:
+        self.instance = instance
+        self.audioCache = audioCache
+        self.margin = margin          # seconds before the expire time to treat url as expired
+        self.defaultTtl = defaultTtl  # used when the url does not have expire time
+        self.capacity = capacity      # enough for the queue window and the previous tracks
+        self.entries = collections.OrderedDict()  # videoId -> (stream url, expire time, media), least recently used first
+        self.pending = collections.deque()
+        self.resolving = set()
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name='stream-resolver', daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def readExpireTime(url):
+        parsed = urllib.parse.urlparse(url)
+        params = urllib.parse.parse_qs(parsed.query)
+        if 'expire' in params:
+            return float(params['expire'][0])
+        parts = parsed.path.split('/')  # some stream urls have parameters in path (/expire/<time>/)
+        if 'expire' in parts and parts.index('expire') + 1 < len(parts):
+            return float(parts[parts.index('expire') + 1])
+        return None
+
+    def get(self, videoId):
+        with self._condition:
+            while True:
+                entry = self._fresh(videoId)
+                if entry is not None:
+                    return entry[2]
+                if videoId not in self.resolving:
+                    break
+                self._condition.wait()  # already being resolved by the background thread
+            self.resolving.add(videoId)
+        return self._resolve(videoId)[2]
+
+    def prefetch(self, *videoIds):
+        with self._condition:
+            for videoId in videoIds:
+                if videoId is None or videoId in self.pending or videoId in self.resolving:
+                    continue
+                if self._fresh(videoId) is None:
+                    self.pending.append(videoId)
+            self._condition.notify_all()
+
+    def invalidate(self, videoId):
+        with self._condition:
+            entry = self.entries.pop(videoId, None)
+        if entry is not None:
+            entry[2].release()
+
+    def streamUrl(self, videoId):
+        with self._condition:
+            entry = self._fresh(videoId)
+        if entry is None or not entry[0].startswith('http'):
+            return None
+        return entry[0]
+
+    def _fresh(self, videoId):
+        entry = self.entries.get(videoId)
+        if entry is not None and entry[1] - self.margin > time.time():
+            self.entries.move_to_end(videoId)
+            return entry
+        return None
+
+    def _evict(self):
+        # called with the condition held; returns media objects to be released
+        now = time.time()
+        evicted = [videoId for videoId, entry in self.entries.items() if entry[1] - self.margin <= now]
+        evicted += [videoId for videoId in self.entries if videoId not in evicted][:max(len(self.entries) - len(evicted) - self.capacity, 0)]
+        return [self.entries.pop(videoId)[2] for videoId in evicted]
+
+    def _resolve(self, videoId):
+        entry = None
+        try:
+            start = time.perf_counter()
+            localPath = self.audioCache.get(videoId) if self.audioCache is not None else None
+            if localPath is not None:
+                entry = (localPath, time.time() + self.defaultTtl, self.instance.media_new_path(localPath))
+                return entry
+
+            video = getFeature('youtubeMusic').pafy.new(f"https://www.youtube.com/watch?v={videoId}")
+            playurl = video.getbestaudio().url
+            expire = StreamResolver.readExpireTime(playurl) or time.time() + self.defaultTtl
+            media = self.instance.media_new(playurl)
+            media.get_mrl()
+            entry = (playurl, expire, media)
+            logging.debug(f'[YOUTUBE MUSIC] Resolved stream of {videoId} in {(time.perf_counter() - start) * 1000:.1f}ms')
+            return entry
+        finally:
+            released = []
+            with self._condition:
+                self.resolving.discard(videoId)
+                if entry is not None:
+                    previous = self.entries.pop(videoId, None)
+                    if previous is not None:
+                        released.append(previous[2])
+                    self.entries[videoId] = entry
+                    released += self._evict()
+                self._condition.notify_all()
+            for media in released:
+                media.release()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: len(self.pending) > 0)
+                videoId = self.pending.popleft()
+                if videoId in self.resolving or self._fresh(videoId) is not None:
+                    continue
+                self.resolving.add(videoId)
+            try:
+                self._resolve(videoId)
+            except Exception as error:
+                logging.warning(f'[YOUTUBE MUSIC] Cannot prefetch stream of {videoId}: {error}')
 
 class StateListner:
     def __init__(self, initial_state=None) -> None:
@@ -850,34 +2006,74 @@ class YouTubeMusicManager:
     LOADING = 2
     INVALID = 3
 
+    SKIP_BACKOFF_MIN = 500    # delay before trying the next track after a failure (ms)
+    SKIP_BACKOFF_MAX = 8000
+    BLACKLIST_SIZE = 500      # number of unplayable videos remembered
+    BLACKLIST_TTL = 24 * 3600  # seconds until a blacklisted video is tried again
+    BLACKLIST_FAILURES = 3     # failures in a row before blacklisting (unless the error is permanent)
+    PERMANENT_ERRORS = ('unavailable', 'private', 'removed', 'copyright', 'age', 'not available')
+
     def __init__(self) -> None:
         if not configurations['youtube-music-enabled']:
             return
 
-        global creds
-        self.creds = creds
+        vlc = getFeature('youtubeMusic').vlc
         self.nextPageToken = None
         self.instance = vlc.Instance()
         self.player = self.instance.media_player_new()
+        self.mediaList = self.instance.media_list_new()
+        self.listPlayer = self.instance.media_list_player_new()
+        self.listPlayer.set_media_player(self.player)
+        self.listPlayer.set_media_list(self.mediaList)
+        self.audioCache = AudioCache(os.path.join(cachesDirectoryPath, 'audio'), configurations['youtube-audio-cache-mb'] * 1024 * 1024)
+        self.resolver = StreamResolver(self.instance, self.audioCache)
         self.player.audio_set_volume(100)
-        self.events = self.player.event_manager()
+        self.events = self.listPlayer.event_manager()
         self.state = StateListner(YouTubeMusicManager.INVALID)
         
-        self.events.event_attach(vlc.EventType.MediaPlayerEndReached, self.autoMoveNext)
+        self.events.event_attach(vlc.EventType.MediaListPlayerNextItemSet, self.autoMoveNext)
+        self.events.event_attach(vlc.EventType.MediaListPlayerPlayed, self.autoMoveEnd)
+
+        # Gapless playback queue
+        self.queueWindow = configurations['youtube-queue-window']
+        self.queue = []              # playlist indexes of the tracks at the media list
+        self.queueEnd = None         # last playlist index tried to be queued
+        self.queueGeneration = 0     # increased whenever the media list is rebuilt
+        self._startPending = False   # media list is rebuilt and should be played from the first track
+        self._queueLock = threading.RLock()
+        self._pageLock = threading.Lock()
+        self._fillEvent = threading.Event()
+        threading.Thread(target=self.fillQueue, name='youtube-queue', daemon=True).start()
+
+        # Track advance with bounded retries
+        self.skipBudget = configurations['youtube-skip-budget']
+        self.advanceGeneration = 0  # increased by every user action, cancels scheduled retries
+        self.blacklist = collections.OrderedDict()  # videoId -> blacklisted time
+        self.failures = {}                          # videoId -> failures in a row (not blacklisted yet)
+        try:
+            for videoId, blacklistedTime in readYouTubeCaches().get('blacklist', {}).items():
+                if time.time() - blacklistedTime < YouTubeMusicManager.BLACKLIST_TTL:
+                    self.blacklist[videoId] = blacklistedTime
+        except Exception:
+            pass
 
         self._ready = False
         self.current_playlist = None
         self.current_index = None
         self.current_query = None
-
-        self.service = build('youtube', 'v3', credentials=self.creds)
+        self.playlistStore = YouTubePlaylistStore(os.path.join(cachesDirectoryPath, 'youtube_playlists'))
+        self.searchCache = YouTubeSearchCache(os.path.join(cachesDirectoryPath, 'youtube_searches'),
+                                              ttl=configurations['youtube-search-cache-ttl'],
+                                              capacity=configurations['youtube-search-cache-size'])
+        self.lastEmotion = None
+        self.lastEmotionTime = None
 
         try:
-            cached_data = readYouTubeCaches()
-            self.current_playlist = cached_data['playlist']
+            self.current_query, self.current_playlist, self.nextPageToken = self.playlistStore.loadActive()
+            if self.current_query is None or len(self.current_playlist) == 0:
+                raise Exception('no active playlist')
             self.current_index = 0
-            self.current_query = cached_data['query']
-            self.setPlayer(self.current_playlist[self.current_index]['id']['videoId'])
+            self.setPlayer(self.current_playlist[self.current_index]['videoId'])
             self._ready = True
             self.state.edit(YouTubeMusicManager.STOPPED)
         except Exception as error:
@@ -885,20 +2081,38 @@ class YouTubeMusicManager:
 
         self.binded = []
 
-    def searchByEmotion(self):
+    @property
+    def creds(self):
+        return getFeature('googleAccount')
+
+    @property
+    def service(self):
+        return googleServiceRegistry.get('youtube', 'v3', self.creds)
+
+    def searchByEmotion(self, cancelled=None):
+        # Returns (emotion, playlist) without changing the player: playlist is applied by 'setPlaylist'
+        # ('invalid' emotion and None playlist on failure)
         if not configurations['youtube-music-enabled']:
-            return 'invalid'
+            return 'invalid', None
         if not configurations['face-emotion-detection-enabled']:
-            return 'invalid'
+            return 'invalid', None
         if not checkWifiConnection():
             logging.error(f'[YOUTUBE MUSIC] Internet connection error')
-            return 'invalid'
+            return 'invalid', None
         
-        emotion_result = faceEmotionDetectModule.detect_motion_webcam()
+        # Reuse recently detected emotion instead of capturing face again
+        if self.lastEmotion is not None and time.monotonic() - self.lastEmotionTime < configurations['emotion-debounce-seconds']:
+            logging.info(f'[YOUTUBE MUSIC] Reusing recent face emotion estimation: {self.lastEmotion}')
+            emotion = self.lastEmotion
+            return emotion, self.fetchPlaylist(query=f"{emotion} musics")
+
+        emotion_result = getFeature('faceEmotionDetector').detect_motion_webcam(cancelled=cancelled)
 
-        if emotion_result['exception'] != face_emotion_detection.azure_api_wrapper.NO_EXCEPTION_MSG:
+        if emotion_result['exception'] != getFeature('faceEmotion').emotion_backend.NO_EXCEPTION_MSG:
             logging.error('[YOUTUBE MUSIC] Exception occurred on detecting face emotion')
-            return 'invalid'
+            return 'invalid', None
+        if cancelled is not None and cancelled():
+            return 'invalid', None  # newer command is given while detecting emotion
 
         pref_result, max_value = None, 0
 
@@ -911,60 +2125,155 @@ class YouTubeMusicManager:
                 pref_result = key
         
         logging.info(f'[YOUTUBE MUSIC] Face emotion estimation: {pref_result}')
+        self.lastEmotion = pref_result
+        self.lastEmotionTime = time.monotonic()
         
-        self.search(query=f"{pref_result} musics")
-        return pref_result
+        return pref_result, self.fetchPlaylist(query=f"{pref_result} musics")
     
     def search(self, query=None, cnt=5, nextpage=False):
-        if not configurations['youtube-music-enabled']:
+        # Fetches and applies the playlist on the caller's thread (use 'fetchPlaylist' on worker threads)
+        if nextpage:
+            if not self.isStopped():
+                self.pause()
+            try:
+                self.loadNextPage(cnt)
+            except Exception as error:
+                logging.error(f'[YOUTUBE MUSIC] Error occurred on loading next page of query({self.current_query}): {error}')
+            self.state.edit(YouTubeMusicManager.STOPPED)
+            self._ready = False
             return
+
+        playlist = self.fetchPlaylist(query, cnt)
+        if playlist is not None:
+            self.setPlaylist(playlist)
+
+    def fetchPlaylist(self, query=None, cnt=5, maxPages=3):
+        # Returns the first page with playable tracks without changing the player (safe on worker threads)
+        if not configurations['youtube-music-enabled']:
+            return None
         if not checkWifiConnection():
             logging.error(f'[YOUTUBE MUSIC] Internet connection error')
-            return
+            return None
 
-        try:
-            if not self.isStopped():
-                self.pause()
+        # Use current query if query is None
+        if query is None:
+            query = self.current_query
+        if query is None:
+            logging.warning('[YOUTUBE MUSIC] Search warning: query required')
+            return None
 
-            # Use current query if query is None
-            if query is None and self.current_query is not None:
-                query = self.current_query
-            elif query is None and self.current_query is None:
-                logging.warning('[YOUTUBE MUSIC] Search warning: query required')
-                raise Exception()
+        items, nextPageToken = [], None
+        try:
+            for _ in range(maxPages):  # every track of a page can be filtered out (e.g. long mixes)
+                search_result = self.requestSearchPage(query, nextPageToken, cnt)
+                items += search_result['items']
+                nextPageToken = search_result.get('nextPageToken')
+                if len(items) > 0 or nextPageToken is None:
+                    break
+        except Exception as error:
+            logging.error(f'[YOUTUBE MUSIC] Error occurred on searching with query({query}): {error}')
+            return None
+        return {'query': query, 'items': items, 'nextPageToken': nextPageToken}
+
+    def setPlaylist(self, playlist):
+        # Replaces the current playlist with the result of 'fetchPlaylist' (called on the GUI thread)
+        if not self.isStopped():
+            self.pause()
+
+        with self._queueLock:
+            self.queueGeneration += 1  # stop queueing tracks of the previous playlist
+            self.nextPageToken = playlist['nextPageToken']
+            self.current_playlist = playlist['items']
+            self.current_query = playlist['query']
+            self.current_index = 0
+        try:
+            self.playlistStore.save(playlist['query'], playlist['items'], playlist['nextPageToken'])
+        except Exception as error:
+            logging.warning(f"[YOUTUBE MUSIC] Cannot save playlist of query({playlist['query']}): {error}")
 
-            # Send request
-            if nextpage and self.nextPageToken is not None:
-                # Search by using the given keyword
-                search_result = self.service.search().list(
-                    q=query, part='snippet', maxResults=cnt, regionCode='KR',
-                    type='video', videoCategoryId='10', pageToken=self.nextPageToken
-                    ).execute()
-            else:
-                # Search by using the given keyword
-                search_result = self.service.search().list(
-                    q=query, part='snippet', maxResults=cnt, regionCode='KR',
-                    type='video', videoCategoryId='10'
-                    ).execute()
-
-            self.nextPageToken = search_result['nextPageToken']
-
-            if nextpage == False:
-                self.current_playlist = search_result['items']
-                self.current_query = query
-                self.current_index = 0
-            elif len(search_result) > 0:
-                self.current_playlist += search_result['items']
-            else:
-                self.current_index = 0
-            
-            writeYouTubeCaches(self.current_playlist, self.current_query)
+        self.state.edit(YouTubeMusicManager.STOPPED)
+        self._ready = False
 
-            self.state.edit(YouTubeMusicManager.STOPPED)
-            self._ready = False
-            
+    def requestSearchPage(self, query, pageToken=None, cnt=5):
+        # Send request (cached results are used without sending request)
+        regionCode, categoryId = 'KR', '10'
+        search_result = self.searchCache.get(query, regionCode, categoryId, pageToken)
+        if search_result is not None:
+            logging.info(f'[YOUTUBE MUSIC] Using cached search result of query({query})')
+            return search_result
+
+        # Search by using the given keyword
+        request = {'q': query, 'part': 'snippet', 'maxResults': cnt, 'regionCode': regionCode,
+                   'type': 'video', 'videoCategoryId': categoryId}
+        if pageToken is not None:
+            request['pageToken'] = pageToken
+        response = self.service.search().list(**request).execute()
+        items, checked = self.enrichTracks([compactTrack(item) for item in response['items']], regionCode)
+        search_result = {'items': items, 'nextPageToken': response.get('nextPageToken')}
+        if checked:  # unfiltered results are not cached, so that they are checked again on the next search
+            self.searchCache.set(query, regionCode, categoryId, search_result, pageToken)
+        return search_result
+
+    def enrichTracks(self, tracks, regionCode):
+        # Fill duration and filter out unplayable tracks with one videos request (up to 50 ids)
+        # Returns (tracks, whether the tracks are checked)
+        try:
+            response = self.service.videos().list(part='contentDetails,status',
+                                                  id=','.join(track['videoId'] for track in tracks[:50])).execute()
         except Exception as error:
-            logging.error(f'[YOUTUBE MUSIC] Error occurred on searching with query({query}): {error}')
+            logging.warning(f'[YOUTUBE MUSIC] Cannot get video details, using {len(tracks)} unfiltered tracks: {error}')
+            return tracks, False  # unchecked tracks are skipped on playing if they are unplayable
+
+        details = {item['id']: item for item in response.get('items', [])}
+        playable = []
+        for track in tracks[:50]:
+            detail = details.get(track['videoId'])
+            reason = self.checkPlayable(detail, regionCode)
+            if reason is not None:
+                logging.info(f"[YOUTUBE MUSIC] Filtered out track({track['videoId']}): {reason}")
+                continue
+            playable.append(dict(track, duration=parseIsoDuration(detail['contentDetails']['duration'])))
+        return playable + tracks[50:], True
+
+    def checkPlayable(self, detail, regionCode):
+        if detail is None:
+            return 'removed video'
+
+        status, contentDetails = detail.get('status', {}), detail.get('contentDetails', {})
+        if status.get('uploadStatus', 'processed') != 'processed' or status.get('privacyStatus') == 'private':
+            return 'unavailable video'
+        if contentDetails.get('contentRating', {}).get('ytRating') == 'ytAgeRestricted':
+            return 'age restricted'
+        restriction = contentDetails.get('regionRestriction', {})
+        if regionCode in restriction.get('blocked', []) or ('allowed' in restriction and regionCode not in restriction['allowed']):
+            return 'blocked in region'
+        duration = parseIsoDuration(contentDetails.get('duration', ''))
+        if duration is None or duration == 0:
+            return 'live stream'
+        if duration > configurations['youtube-max-duration']:
+            return f'too long ({duration}s)'
+        return None
+
+    def loadNextPage(self, cnt=5, maxPages=3):
+        with self._pageLock:  # next page can be requested by both queue thread and user
+            for _ in range(maxPages):  # every track of a page can be filtered out
+                query, pageToken = self.current_query, self.nextPageToken
+                if query is None:
+                    return False
+
+                search_result = self.requestSearchPage(query, pageToken, cnt)
+                with self._queueLock:
+                    if query != self.current_query or pageToken != self.nextPageToken:
+                        return False  # playlist is changed while requesting
+                    self.nextPageToken = search_result.get('nextPageToken')
+                    self.current_playlist += search_result['items']
+                self.playlistStore.append(query, pageToken, search_result['items'], self.nextPageToken)
+                logging.info(f"[YOUTUBE MUSIC] Loaded {len(search_result['items'])} more tracks of query({query})")
+                if len(search_result['items']) > 0:
+                    return True
+                if self.nextPageToken is None:
+                    return False
+            return False
     
     def setPlayer(self, videoId):
         if not configurations['youtube-music-enabled']:
@@ -972,38 +2281,107 @@ class YouTubeMusicManager:
 
         self.state.edit(YouTubeMusicManager.LOADING)
         self._ready = False
- 
-        video_url = f"https://www.youtube.com/watch?v={videoId}"
-        video = pafy.new(video_url)
-        best = video.getbestaudio()
-        playurl = best.url
 
-        media = self.instance.media_new(playurl)
-        media.get_mrl()
-        self.player.set_media(media)
+        media = self.resolver.get(videoId)  # ready immediately if the track is prefetched
+
+        # Rebuild the queue starting from the current track
+        with self._queueLock:
+            self.queueGeneration += 1
+            self.mediaList = self.instance.media_list_new()
+            self.mediaList.add_media(media)
+            self.listPlayer.set_media_list(self.mediaList)
+            self.queue = [self.current_index]
+            self.queueEnd = self.current_index
+            self._startPending = True
 
         self._ready = True
+        self.prefetchNeighbors()
+        self._fillEvent.set()
+
+    def startPlayback(self):
+        if self._startPending:
+            self._startPending = False
+            self.listPlayer.play_item_at_index(0)
+        else:
+            self.listPlayer.play()
+
+    def fillQueue(self):  # runs on the queue thread
+        while True:
+            self._fillEvent.wait()
+            self._fillEvent.clear()
+            try:
+                while self.queueNextTrack():
+                    pass
+            except Exception as error:
+                logging.error(f'[YOUTUBE MUSIC] Error occurred on queueing tracks: {error}')
+
+    def queueNextTrack(self):
+        with self._queueLock:
+            if not self._ready or self.current_playlist is None or self.queueEnd is None or self.current_index is None:
+                return False
+            if self.queueEnd - self.current_index >= self.queueWindow:
+                return False
+            nextIndex = self.queueEnd + 1
+            generation = self.queueGeneration
+
+        # Request next page before the queue runs dry
+        if nextIndex >= len(self.current_playlist) - 1 and self.nextPageToken is not None:
+            if checkWifiConnection():
+                self.loadNextPage()
+        if nextIndex >= len(self.current_playlist):
+            return False
+
+        videoId = self.current_playlist[nextIndex]['videoId']
+        media = None
+        if not self.isBlacklisted(videoId):
+            try:
+                media = self.resolver.get(videoId)
+            except Exception as error:
+                logging.warning(f'[YOUTUBE MUSIC] Cannot queue track {videoId}: {error}')
+                if checkWifiConnection():
+                    self.reportFailure(videoId, error)
+
+        with self._queueLock:
+            if generation != self.queueGeneration:
+                return True  # queue is rebuilt while resolving
+            self.queueEnd = nextIndex
+            if media is not None:
+                self.mediaList.lock()
+                self.mediaList.add_media(media)
+                self.mediaList.unlock()
+                self.queue.append(nextIndex)
+        return True
+
+    def queuedPosition(self, index):
+        with self._queueLock:
+            if index in self.queue:
+                return self.queue.index(index)
+            return -1
+
+    def prefetchNeighbors(self):
+        if self.current_playlist is None or self.current_index is None or len(self.current_playlist) == 0:
+            return
+        nextIndex = (self.current_index + 1) % len(self.current_playlist)
+        prevIndex = (self.current_index - 1) % len(self.current_playlist)
+        videoIds = [self.current_playlist[index]['videoId'] for index in (nextIndex, prevIndex)]
+        self.resolver.prefetch(*[videoId for videoId in videoIds if not self.isBlacklisted(videoId)])
     
     def moveNext(self):
         if not configurations['youtube-music-enabled']:
             return
 
+        # Next track is already queued: play it without rebuilding the queue
+        position = self.queuedPosition(self.current_index)
+        if self._ready and 0 <= position < len(self.queue) - 1:
+            self.current_index = self.queue[position + 1]
+            self.listPlayer.next()
+            self.state.edit(YouTubeMusicManager.PLAYING)
+            self._fillEvent.set()
+            return
+
         # self.state.edit(YouTubeMusicManager.LOADING)
         self.player.pause()
-
-        self.current_index += 1
-        if self.current_index >= len(self.current_playlist):
-                self.search(nextpage=True)
-        try:
-            self.setPlayer(self.current_playlist[self.current_index]['id']['videoId'])
-            self.player.play()
-            if self.player.get_state() == vlc.State.Error:
-                logging.error('[YOUTUBE MUSIC] Error ocurred on playing music')
-                raise Exception()
-            self.state.edit(YouTubeMusicManager.PLAYING)
-        except Exception as error:
-            logging.info(f'[YOUTUBE MUSIC] Skip next')
-            self.moveNext()
+        self.advance(1)
 
     def movePrev(self):
         if not configurations['youtube-music-enabled']:
@@ -1011,57 +2389,169 @@ class YouTubeMusicManager:
 
         # self.state.edit(YouTubeMusicManager.LOADING)
         self.player.pause()
-            
-        self.current_index -= 1
-        if self.current_index < 0:
-            self.current_index = len(self.current_playlist) - 1
+        self.advance(-1)
+
+    def advance(self, step, budget=None, delay=None):
+        # Plays the track 'step' away from the current track (skipping blacklisted videos)
+        # On failure, the next track is tried later with exponential backoff (not recursively)
+        # until 'youtube-skip-budget' tracks have failed in a row
+        if budget is None:
+            budget = self.skipBudget
+            self.advanceGeneration += 1
+        generation = self.advanceGeneration
+
+        index = self.findTrack(self.current_index, step)
+        if index is None:
+            logging.error('[YOUTUBE MUSIC] There is no playable track')
+            self.state.edit(YouTubeMusicManager.STOPPED)
+            return False
+
+        self.current_index = index
+        videoId = self.current_playlist[index]['videoId']
         try:
-            self.setPlayer(self.current_playlist[self.current_index]['id']['videoId'])
-            self.player.play()
-            if self.player.get_state() == vlc.State.Error:
+            self.setPlayer(videoId)
+            self.startPlayback()
+            if self.player.get_state() == getFeature('youtubeMusic').vlc.State.Error:
                 logging.error('[YOUTUBE MUSIC] Error ocurred on playing music')
-                raise Exception()
+                raise Exception('vlc player error')
             self.state.edit(YouTubeMusicManager.PLAYING)
+            self.failures.pop(videoId, None)
+            return True
         except Exception as error:
-            logging.info(f'[YOUTUBE MUSIC] Skip prev')
-            self.movePrev()
+            logging.info(f'[YOUTUBE MUSIC] Skip {videoId}: {error}')
+            failure = error
+
+        if not checkWifiConnection():
+            logging.error(f'[YOUTUBE MUSIC] Internet connection error')
+            self.state.edit(YouTubeMusicManager.STOPPED)
+            return False
+
+        self.reportFailure(videoId, failure)
+        if budget <= 1:
+            logging.error(f'[YOUTUBE MUSIC] Stopped after skipping {self.skipBudget} tracks in a row')
+            self.state.edit(YouTubeMusicManager.STOPPED)
+            return False
+
+        delay = YouTubeMusicManager.SKIP_BACKOFF_MIN if delay is None else min(delay * 2, YouTubeMusicManager.SKIP_BACKOFF_MAX)
+        gobject.timeout_add(delay, self.retryAdvance, generation, step if step != 0 else 1, budget - 1, delay)
+        return False
+
+    def retryAdvance(self, generation, step, budget, delay):
+        if generation == self.advanceGeneration:  # not cancelled by another user action
+            self.advance(step, budget, delay)
+        return False
+
+    def findTrack(self, index, step):
+        if self.current_playlist is None or len(self.current_playlist) == 0:
+            return None
+
+        index = 0 if index is None else index + step
+        for _ in range(len(self.current_playlist) + 1):
+            if index < 0:
+                index = len(self.current_playlist) - 1
+            if index >= len(self.current_playlist):
+                try:
+                    if not self.loadNextPage():
+                        return None
+                except Exception as error:
+                    logging.error(f'[YOUTUBE MUSIC] Error occurred on loading next page: {error}')
+                    return None
+            if not self.isBlacklisted(self.current_playlist[index]['videoId']):
+                return index
+            index += step if step != 0 else 1
+        return None
+
+    def isBlacklisted(self, videoId):
+        with self._queueLock:
+            blacklistedTime = self.blacklist.get(videoId)
+            if blacklistedTime is None:
+                return False
+            if time.time() - blacklistedTime < YouTubeMusicManager.BLACKLIST_TTL:
+                return True
+            del self.blacklist[videoId]  # expired: try the video again
+            return False
+
+    def reportFailure(self, videoId, error):
+        # transient errors (network, stream signature ...) are tolerated a few times before blacklisting
+        permanent = any(keyword in str(error).lower() for keyword in YouTubeMusicManager.PERMANENT_ERRORS)
+        if not permanent and not connectivityMonitor.isConnected():  # uncached tracks cannot be resolved offline
+            self.resolver.invalidate(videoId)
+            return
+        with self._queueLock:
+            self.failures[videoId] = self.failures.get(videoId, 0) + 1
+            if not permanent and self.failures[videoId] < YouTubeMusicManager.BLACKLIST_FAILURES:
+                self.resolver.invalidate(videoId)
+                return
+            del self.failures[videoId]
+        self.addBlacklist(videoId)
+
+    def addBlacklist(self, videoId):
+        with self._queueLock:
+            now = time.time()
+            self.blacklist[videoId] = now
+            for expired in [key for key, blacklistedTime in self.blacklist.items() if now - blacklistedTime >= YouTubeMusicManager.BLACKLIST_TTL]:
+                del self.blacklist[expired]
+            while len(self.blacklist) > YouTubeMusicManager.BLACKLIST_SIZE:
+                self.blacklist.popitem(last=False)
+            blacklist = dict(self.blacklist)
+        self.resolver.invalidate(videoId)
+        writeYouTubeCaches(blacklist=blacklist)
+        logging.info(f'[YOUTUBE MUSIC] Blacklisted unplayable video {videoId}')
     
-    @vlc.callbackmethod
     def autoMoveNext(self, data):
         if not configurations['youtube-music-enabled']:
             return
 
-        gobject.idle_add(self.moveNext)
+        gobject.idle_add(self.acceptNextItem)
+
+    def autoMoveEnd(self, data):
+        if not configurations['youtube-music-enabled']:
+            return
+
+        gobject.idle_add(self.moveNext)  # queue ran dry before the last track ended
+
+    def acceptNextItem(self):
+        # media list player moved on to the next queued track
+        with self._queueLock:
+            position = self.mediaList.index_of_item(self.player.get_media())
+            if 0 <= position < len(self.queue):
+                self.current_index = self.queue[position]
+        if self.isPlaying() or self.isLoading():
+            self.state.edit(YouTubeMusicManager.PLAYING)
+        if self.current_playlist is not None and self.current_index is not None:
+            videoId = self.current_playlist[self.current_index]['videoId']
+            self.audioCache.fill(videoId, self.resolver.streamUrl(videoId))  # cache the track while playing
+        self.prefetchNeighbors()
+        self._fillEvent.set()
+        return False
 
     def play(self):
         if not configurations['youtube-music-enabled']:
             return
 
         # self.state.edit(YouTubeMusicManager.LOADING)
+        if not self._ready:
+            if self.current_playlist is None or self.current_query is None:
+                self.state.edit(YouTubeMusicManager.STOPPED)
+                return
+            self.advance(0)
+            return
+
         try:
-            if not self._ready:
-                if self.current_playlist is not None and self.current_query is not None:
-                    if self.current_index is None:
-                        self.current_index = 0
-                else:
-                    self.state.edit(YouTubeMusicManager.STOPPED)
-                    return
-                self.setPlayer(self.current_playlist[self.current_index]['id']['videoId'])
-            self.player.play()
-            if self.player.get_state() == vlc.State.Error:
+            self.startPlayback()
+            if self.player.get_state() == getFeature('youtubeMusic').vlc.State.Error:
                 logging.error('[YOUTUBE MUSIC] Error ocurred on playing music')
                 raise Exception()
             self.state.edit(YouTubeMusicManager.PLAYING)
         except Exception as error:
             logging.info(f'[YOUTUBE MUSIC] Skipped because an error occurred on playing music: {error}')
-            self.moveNext()
-            self.play()
+            self.advance(1)
 
     def pause(self):
         if not configurations['youtube-music-enabled']:
             return
 
-        if self.player.get_state() != vlc.State.Paused:
+        if self.player.get_state() != getFeature('youtubeMusic').vlc.State.Paused:
             self.player.pause()
             self.state.edit(YouTubeMusicManager.STOPPED)
 
@@ -1095,8 +2585,11 @@ class YouTubeMusicManager:
 # Note:
 #   Module for style recommendation (searching and uploading result to google drive storage)
 
-if configurations['style-recommendation-enabled']:
+def loadReverseImage():
     os.environ['AWS_SHARED_CREDENTIALS_FILE'] = os.path.join(os.path.expanduser('~'), '.aws', 'credentials')
+    return importModule('reverse_image_api_wrapper')
+
+featureRegistry.register('reverseImage', loadReverseImage, 'style-recommendation-enabled')
 
 def removeAllImgCaches():
     for filename in os.listdir(os.path.join(os.curdir, 'caches')):
@@ -1107,20 +2600,27 @@ class StyleRecommendationManager:
     def __init__(self):
         self.reverse_search_apikey = apikeys['reverse-search-apikey']
         self.s3_bucket_name = apikeys['s3-bucket-name']
-        self.reverse_search_inst = reverse_image_api_wrapper.ReverseSearchApi(apikey=self.reverse_search_apikey,
-                                                                              bucket_name=self.s3_bucket_name)
+        self._reverse_search_inst = None
         self.user_style_filename = None
         self.cached_result = None
         self.uploader = StyleUploader()
 
+    @property
+    def reverse_search_inst(self):
+        if self._reverse_search_inst is None:
+            reverse_image_api_wrapper = getFeature('reverseImage')
+            self._reverse_search_inst = reverse_image_api_wrapper.ReverseSearchApi(apikey=self.reverse_search_apikey,
+                                                                                   bucket_name=self.s3_bucket_name)
+        return self._reverse_search_inst
+
     def capture(self):
         if not configurations['style-recommendation-enabled']:
             logging.error(f"[STYLE RECOMMENDATION] Style recommendation is not enabled")
             return False
 
-        cap = cv2.VideoCapture(0)
-        ret, frame = cap.read()
-        if ret == False:
+        cv2 = getFeature('cv2')
+        _, frame = getFeature('camera').read()
+        if frame is None:
             logging.error('[STYLE RECOMMENDATION] Frame capture error occured. Exiting feature...')
             return False
 
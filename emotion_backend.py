@@ -0,0 +1,123 @@
+import abc
+import logging
+import threading
+import json
+
+import cv2
+import numpy as np
+
+
+NO_EXCEPTION_MSG = 'no exception'
+NO_ITERATION_MSG = 'no further iteration'
+
+EMOTIONS = ('anger', 'contempt', 'disgust', 'fear', 'happiness', 'neutral', 'sadness', 'surprise')
+
+
+# Emotion backend
+#
+# Note:
+#   Interface of facial emotion inference modules
+#   'detect_face_src' gets image source (and optionally the face box found by local face detection)
+#   and returns the probability of each emotion in EMOTIONS with 'exception' key:
+#       {
+#           'exception': NO_EXCEPTION_MSG,
+#           'anger': 0.0, 'contempt': 0.0, 'disgust': 0.0, 'fear': 0.0,
+#           'happiness': 0.0, 'neutral': 0.0, 'sadness': 0.0, 'surprise': 0.993,
+#       }
+#   On error, returns {'exception': (error message)}
+#   (NO_ITERATION_MSG means that trying again with another frame is not useful)
+#
+#   Backends:
+#     * azure: Azure Face API (see azure_api_wrapper.py)
+#     * local: FER+ classifier running on CPU with OpenCV DNN (works offline)
+
+class EmotionBackend(abc.ABC):
+    name = None
+
+    @abc.abstractmethod
+    def detect_face_src(self, image, box=None):
+        pass
+
+
+# Local emotion backend
+#
+# Note:
+#   Runs the FER+ ONNX model (emotion-ferplus-8.onnx from the ONNX model zoo) with OpenCV DNN
+#   Model is loaded on first use; input is a 64x64 grayscale face crop
+#   Download the model into 'model' directory:
+#     => https://github.com/onnx/models/tree/main/validated/vision/body_analysis/emotion_ferplus
+
+class LocalEmotionApi(EmotionBackend):
+    name = 'local'
+    INPUT_SIZE = (64, 64)
+    LABELS = ('neutral', 'happiness', 'surprise', 'sadness', 'anger', 'disgust', 'fear', 'contempt')  # model output order
+
+    def __init__(self, model_path='model/emotion-ferplus-8.onnx', margin=0.1, min_face_size=32):
+        self.model_path = model_path
+        self.margin = margin                # face box is enlarged by this ratio on each side
+        self.min_face_size = min_face_size  # smaller faces are not reliable
+        self.net = None
+        self._lock = threading.Lock()
+
+    def detect_face_src(self, image, box=None):
+        j = json.loads('{}')
+
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            image = cv2.imdecode(np.frombuffer(image, dtype=np.uint8), cv2.IMREAD_COLOR)
+        elif isinstance(image, str):
+            image = cv2.imread(image)
+        if image is None:
+            msg = {'exception': 'Image decoding error'}
+            j.update(msg)
+            return j
+
+        face = self._crop(image, box)
+        if face.shape[0] < self.min_face_size or face.shape[1] < self.min_face_size:
+            msg = {'exception': 'Face is too small'}
+            j.update(msg)
+            return j
+
+        gray = cv2.cvtColor(face, cv2.COLOR_BGR2GRAY)
+        blob = cv2.resize(gray, LocalEmotionApi.INPUT_SIZE, interpolation=cv2.INTER_AREA).astype(np.float32)
+        blob = blob.reshape(1, 1, LocalEmotionApi.INPUT_SIZE[1], LocalEmotionApi.INPUT_SIZE[0])
+
+        logging.info('[LOCAL EMOTION] Detecting emotion')
+        try:
+            with self._lock:
+                if self.net is None:
+                    self.net = cv2.dnn.readNetFromONNX(self.model_path)
+                self.net.setInput(blob)
+                scores = self.net.forward().flatten()
+        except Exception as error:
+            logging.error(f'[LOCAL EMOTION] Fatal error ocurred on inference: {error}')
+            msg = {'exception': 'Emotion inference error'}
+            j.update(msg)
+            return j
+
+        probabilities = np.exp(scores - scores.max())
+        probabilities /= probabilities.sum()
+
+        ret = {'exception': NO_EXCEPTION_MSG}
+        for label, probability in zip(LocalEmotionApi.LABELS, probabilities):
+            ret[label] = round(float(probability), 3)
+        j.update(ret)
+
+        return j
+
+    def _crop(self, image, box):
+        if box is None:
+            return image
+        height, width = image.shape[:2]
+        margin_x, margin_y = (box[2] - box[0]) * self.margin, (box[3] - box[1]) * self.margin
+        start_x, end_x = int(max(box[0] - margin_x, 0.0) * width), int(min(box[2] + margin_x, 1.0) * width)
+        start_y, end_y = int(max(box[1] - margin_y, 0.0) * height), int(min(box[3] + margin_y, 1.0) * height)
+        return image[start_y:end_y, start_x:end_x]
+
+
+def create_emotion_backend(name, apikey=None, endpoint=None, jpeg_quality=85, max_width=640, model_path='model/emotion-ferplus-8.onnx'):
+    if name == 'local':
+        return LocalEmotionApi(model_path=model_path)
+    if name == 'azure':
+        import azure_api_wrapper  # azure SDK is required only by azure backend
+        return azure_api_wrapper.AzureFaceApi(apikey=apikey, endpoint=endpoint, jpeg_quality=jpeg_quality, max_width=max_width)
+    raise ValueError(f'unknown emotion backend: {name}')
@@ -2,42 +2,283 @@ import os
 import sys
 import json
 import time
-import datetime
 import logging
-import azure_api_wrapper
+import threading
+import emotion_backend
+import camera_manager
 
 
 #---------------------------------------------------
 # this part is for local face detection
-# function 'detect_faces' perform DNN with 
+# 'FaceDetectionPipeline' performs DNN with batches of frames
 import cv2
-import imutils
+import numpy as np
 #DNN model source path which will be used in cv2.dnn
 face_detection_prototxt = 'model/deploy.prototxt'
 face_detection_model = 'model/res10_300x300_ssd_iter_140000.caffemodel'
-net = cv2.dnn.readNetFromCaffe(face_detection_prototxt, face_detection_model)
-
-def detect_faces(frame):
-    image = imutils.resize(frame, width=400)
-    blob = cv2.dnn.blobFromImage(cv2.resize(image, (300, 300)), 1.0, (300, 300), (104.0, 177.0, 123.0))
-    net.setInput(blob)
-    detections = net.forward()
-    return detections
+
+face_detection_input_size = (300, 300)
+face_detection_mean = (104.0, 177.0, 123.0)
+
+def read_rss_kb():
+    # resident memory of this process (linux only)
+    try:
+        with open('/proc/self/status', 'rt') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+# Face detector model
+#
+# Note:
+#   Loads the caffe face detection network on first use (not at import time)
+#   Network is shared between threads; 'forward' runs one inference at a time
+#   Options (set by 'configure' before the network is loaded):
+#     * backend: 'default', 'opencv', 'openvino', 'cuda' (falls back to 'default' if not available)
+#     * target: 'cpu', 'opencl', 'opencl_fp16', 'myriad', 'cuda' (falls back to 'cpu' if not available)
+#   'warm_up' runs one inference so that the first real detection is not slowed down
+#   'report' gives load time, warm up time and resident memory (kB) before and after loading
+
+class FaceDetectorModel:
+    BACKENDS = {
+        'default': 'DNN_BACKEND_DEFAULT',
+        'opencv': 'DNN_BACKEND_OPENCV',
+        'openvino': 'DNN_BACKEND_INFERENCE_ENGINE',
+        'cuda': 'DNN_BACKEND_CUDA',
+    }
+    TARGETS = {
+        'cpu': 'DNN_TARGET_CPU',
+        'opencl': 'DNN_TARGET_OPENCL',
+        'opencl_fp16': 'DNN_TARGET_OPENCL_FP16',
+        'myriad': 'DNN_TARGET_MYRIAD',
+        'cuda': 'DNN_TARGET_CUDA',
+    }
+
+    def __init__(self, prototxt, model, backend='default', target='cpu'):
+        self.prototxt = prototxt
+        self.model = model
+        self.backend = backend
+        self.target = target
+        self.net = None
+        self.warmed_up = False
+        self.stats = {}
+        self._load_lock = threading.Lock()
+        self._forward_lock = threading.Lock()
+
+    def configure(self, backend=None, target=None):
+        if self.net is not None:
+            logging.warning('[FACE DETECTOR] Model is already loaded: configuration is applied on next load')
+        if backend is not None:
+            self.backend = backend
+        if target is not None:
+            self.target = target
+
+    def get(self):
+        if self.net is None:
+            with self._load_lock:
+                if self.net is None:
+                    self.net = self._load()
+        return self.net
+
+    def forward(self, blob):
+        net = self.get()
+        with self._forward_lock:
+            net.setInput(blob)
+            return net.forward()
+
+    def warm_up(self):
+        if self.warmed_up:
+            return
+        start = time.perf_counter()
+        image = np.zeros((face_detection_input_size[1], face_detection_input_size[0], 3), dtype=np.uint8)
+        blob = cv2.dnn.blobFromImage(image, 1.0, face_detection_input_size, face_detection_mean)
+        try:
+            self.forward(blob)
+        except cv2.error as error:
+            if (self.backend, self.target) == ('default', 'cpu'):
+                raise
+            # backend can exist in cv2.dnn without being built in: fall back to the default backend
+            logging.warning(f'[FACE DETECTOR] Inference failed on {self.backend}/{self.target}: using default/cpu ({error})')
+            self.release()
+            self.configure(backend='default', target='cpu')
+            self.forward(blob)
+        self.warmed_up = True
+        self.stats['warm_up_ms'] = (time.perf_counter() - start) * 1000
+        logging.info(f"[FACE DETECTOR] Warmed up in {self.stats['warm_up_ms']:.1f}ms")
+
+    def release(self):
+        with self._load_lock:
+            self.net = None
+            self.warmed_up = False
+
+    def report(self):
+        return dict(self.stats)
+
+    def _load(self):
+        rss_before = read_rss_kb()
+        start = time.perf_counter()
+
+        net = cv2.dnn.readNetFromCaffe(self.prototxt, self.model)
+
+        backend, target = self._select(net)
+        self.stats = {
+            'load_ms': (time.perf_counter() - start) * 1000,
+            'rss_before_kb': rss_before,
+            'rss_after_kb': read_rss_kb(),
+            'backend': backend,
+            'target': target,
+        }
+        logging.info(f"[FACE DETECTOR] Model loaded in {self.stats['load_ms']:.1f}ms (backend: {backend}, target: {target}, "
+                     f"rss: {self.stats['rss_before_kb']}kB -> {self.stats['rss_after_kb']}kB)")
+        return net
+
+    def _select(self, net):
+        backend = self.backend if hasattr(cv2.dnn, FaceDetectorModel.BACKENDS.get(self.backend, '')) else 'default'
+        target = self.target if hasattr(cv2.dnn, FaceDetectorModel.TARGETS.get(self.target, '')) else 'cpu'
+        if (backend, target) != (self.backend, self.target):
+            logging.warning(f'[FACE DETECTOR] Backend {self.backend}/{self.target} is not available: using {backend}/{target}')
+
+        net.setPreferableBackend(getattr(cv2.dnn, FaceDetectorModel.BACKENDS[backend]))
+        net.setPreferableTarget(getattr(cv2.dnn, FaceDetectorModel.TARGETS[target]))
+        return backend, target
+
+face_detector = FaceDetectorModel(face_detection_prototxt, face_detection_model)
 #---------------------------------------------------
 
-def removeAllImgCaches():
-    for filename in os.listdir(os.path.join(os.curdir, 'caches')):
-        if filename.endswith('.jpg'):
-            os.remove(os.path.join(os.curdir, 'caches', filename))
+
+# Face detection pipeline
+#
+# Note:
+#   Finds the best face frame among recently captured frames
+#   Stages:
+#     * preprocess: downsample each frame once to the network input size
+#     * gate: skip frames that are too dark/bright or unchanged since the last checked frame
+#     * inference: run the face detection network on a batch of frames (blobFromImages)
+#     * scoring: score each detected face by confidence x sharpness (variance of laplacian)
+#   Only the best scored frame needs to be sent to face api
+#   Per-stage timings and processed frames per second are given by 'report'
+
+class FaceCandidate:
+    def __init__(self, frame, confidence, sharpness, box):
+        self.frame = frame
+        self.confidence = confidence
+        self.sharpness = sharpness
+        self.box = box  # (start x, start y, end x, end y) in ratio of the frame size
+
+    @property
+    def score(self):
+        return self.confidence * self.sharpness
+
+class FaceDetectionPipeline:
+    STAGES = ('preprocess', 'gate', 'inference', 'scoring')
+
+    def __init__(self, confidence_threshold=0.5, motion_threshold=1.0, max_unchanged=15, min_brightness=40, max_brightness=220):
+        self.confidence_threshold = confidence_threshold
+        self.motion_threshold = motion_threshold  # minimum mean absolute difference from the last checked frame
+        self.max_unchanged = max_unchanged        # unchanged frames are checked again after this many frames
+        self.min_brightness = min_brightness
+        self.max_brightness = max_brightness
+        self.reset()
+
+    def reset(self):
+        self.previous_gray = None
+        self.unchanged_count = 0
+        self.timings = {stage: 0.0 for stage in FaceDetectionPipeline.STAGES}  # total elapsed time (ms)
+        self.frame_count = 0
+        self.skipped_count = 0
+        self.started = time.perf_counter()
+
+    def process(self, frames):
+        images, sources = [], []
+
+        start = time.perf_counter()
+        resized = [cv2.resize(frame, face_detection_input_size, interpolation=cv2.INTER_AREA) for frame in frames]
+        self._record('preprocess', start)
+
+        start = time.perf_counter()
+        for frame, image in zip(frames, resized):
+            if self._gate(image):
+                images.append(image)
+                sources.append(frame)
+            else:
+                self.skipped_count += 1
+        self.frame_count += len(frames)
+        self._record('gate', start)
+
+        if len(images) == 0:
+            return None
+
+        start = time.perf_counter()
+        blob = cv2.dnn.blobFromImages(images, 1.0, face_detection_input_size, face_detection_mean)
+        detections = face_detector.forward(blob)  # (1, 1, N, 7): [image id, class id, confidence, box (4)]
+        self._record('inference', start)
+
+        start = time.perf_counter()
+        best = None
+        for detection in detections[0, 0]:
+            confidence = float(detection[2])
+            if confidence < self.confidence_threshold:
+                continue
+            image_id = int(detection[0])
+            box = tuple(float(min(max(value, 0.0), 1.0)) for value in detection[3:7])
+            candidate = FaceCandidate(sources[image_id], confidence, self._sharpness(images[image_id], box), box)
+            if best is None or candidate.score > best.score:
+                best = candidate
+        self._record('scoring', start)
+
+        return best
+
+    def report(self):
+        elapsed = time.perf_counter() - self.started
+        report = {stage: value for stage, value in self.timings.items()}
+        report['frames'] = self.frame_count
+        report['skipped'] = self.skipped_count
+        report['fps'] = self.frame_count / elapsed if elapsed > 0 else 0.0
+        return report
+
+    def _gate(self, image):
+        gray = cv2.cvtColor(cv2.resize(image, (75, 75), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+        brightness = gray.mean()
+        if brightness < self.min_brightness or brightness > self.max_brightness:
+            return False
+
+        if self.previous_gray is not None and self.unchanged_count < self.max_unchanged:
+            if cv2.absdiff(gray, self.previous_gray).mean() < self.motion_threshold:
+                self.unchanged_count += 1
+                return False
+
+        self.previous_gray = gray
+        self.unchanged_count = 0
+        return True
+
+    def _sharpness(self, image, box):
+        height, width = image.shape[:2]
+        face = image[int(box[1] * height):int(box[3] * height), int(box[0] * width):int(box[2] * width)]
+        if face.size == 0:
+            return 0.0
+        return float(cv2.Laplacian(cv2.cvtColor(face, cv2.COLOR_BGR2GRAY), cv2.CV_64F).var())
+
+    def _record(self, stage, start):
+        self.timings[stage] += (time.perf_counter() - start) * 1000
 
 
 # Usage: 
 #   (variable) = MirrorFaceDetect() to initialize
+#   'backend' selects emotion backend: 'azure' (Azure Face API) or 'local' (FER+ model on CPU)
 class MirrorFaceDetect:
-    def __init__(self, face_apikey, face_api_endpoint):
-        self.face_api = azure_api_wrapper.AzureFaceApi(apikey=face_apikey, endpoint=face_api_endpoint)
+    def __init__(self, face_apikey=None, face_api_endpoint=None, jpeg_quality=85, max_width=640,
+                 backend='azure', model_path='model/emotion-ferplus-8.onnx'):
+        self.face_api = emotion_backend.create_emotion_backend(backend, apikey=face_apikey, endpoint=face_api_endpoint,
+                                                               jpeg_quality=jpeg_quality, max_width=max_width,
+                                                               model_path=model_path)
+        self.pipeline = FaceDetectionPipeline()
+        self.batch_size = 4  # number of recent frames checked at once
 
-    def detect_motion_webcam(self):
+    def detect_motion_webcam(self, cancelled=None):
         # initialize variable in Json format, to return exception string
         j = json.loads('{}')
         
@@ -46,12 +287,11 @@ class MirrorFaceDetect:
         self.stamp = time.time()
 
         # check if USB webcam is connected
-        # USB webcam initialization (may be also applicable for raspberry pi)
-        cap = cv2.VideoCapture(0)
-        if (cap.isOpened() == False):
-            msg = {'exception': 'Webcam is not available'}
-            j.update(msg)
-            return j
+        # USB webcam is shared with other features through the camera manager
+        camera = camera_manager.CameraManager.instance()
+        camera.start()
+        index = None
+        self.pipeline.reset()
         # check if motion is not detected, through PIR motion sensor
         # sensor is not available, so this feature is diabled.
         # if PIR == 0:
@@ -62,48 +302,51 @@ class MirrorFaceDetect:
             # check if time is exceeded, so that camera is not running over 60 seconds
             # if PIR sensor is available, this feature is now useful
             if time.time() - self.stamp > 20:
+                self.log_pipeline_report()
                 msg = {'exception': 'Time exceeded'}
                 j.update(msg)
                 return j
+            # stop if the caller does not need the result anymore (e.g. newer command is given)
+            if cancelled is not None and cancelled():
+                msg = {'exception': 'Cancelled'}
+                j.update(msg)
+                return j
             # if motion is detected(or be directly executed if PIR sensor is diabled), execute below
-            # capture one frame from Webcam
-            ret, frame = cap.read()
-            if ret == False:
-                msg = {'exception': 'Frame capture error'}
+            # get frames captured after the last checked frame from Webcam
+            frames = camera.recent(self.batch_size, after=index)
+            if len(frames) == 0:
+                if not camera.available:
+                    msg = {'exception': 'Webcam is not available'}
+                else:
+                    msg = {'exception': 'Frame capture error'}
                 j.update(msg)
                 return j
-            # Do actions with captured image    
-            detections = detect_faces(frame)
-            self.appearance = 0
-            for i in range(0, detections.shape[2]):
-                confidence = detections[0, 0, i, 2]
-                if confidence > 0.5:
-                    self.appearance += 1
+            index = frames[-1][0]
+            # Do actions with captured images
+            candidate = self.pipeline.process([frame for _, frame in frames])
             # check whether face is (faces are) detected or not
-            if self.appearance <= 0:
+            if candidate is None:
                 msg = {'exception': 'Face not detected'}
                 logging.info(f"[FACE EMOTION] Error ocurred on detecting face: {msg['exception']}")
                 continue
 
-            # if yes, save the image into Jpeg format
-            # and save it to capture/ directory
-            logging.info('[FACE EMOTION] Face detected')
-            tm = datetime.datetime.now()
-            stamp = f"{tm:%Y%m%d-%H%M%S}"
-            self.face_filename = "face-" + stamp + ".jpg"
-            logging.info(f'[FACE EMOTION] Saving captured picture as {self.face_filename}')
-            cv2.imwrite(os.path.join('caches', self.face_filename), frame)
+            # if yes, hand the best frame over to face api in memory (encoded once, no image file)
+            logging.info(f'[FACE EMOTION] Face detected (confidence: {candidate.confidence:.2f}, sharpness: {candidate.sharpness:.1f})')
+            self.log_pipeline_report()
 
             # call face api and get emotion string
             logging.info('[FACE EMOTION] Detecting emotion')
-            self.result = self.face_api.detect_face_src(os.path.join('caches', self.face_filename))
-            removeAllImgCaches()
+            self.result = self.face_api.detect_face_src(candidate.frame, box=candidate.box)
             
-            if self.result['exception'] != azure_api_wrapper.NO_EXCEPTION_MSG:
+            if self.result['exception'] != emotion_backend.NO_EXCEPTION_MSG:
                 logging.info(f"[FACE EMOTION] Error ocurred on detecting emotion: {self.result['exception']}")
-                if self.result['exception'] != azure_api_wrapper.NO_ITERATION_MSG:
+                if self.result['exception'] != emotion_backend.NO_ITERATION_MSG:
                     continue
         
             # return and send the data into Json format
             return self.result
 
+    def log_pipeline_report(self):
+        report = self.pipeline.report()
+        timings = ', '.join(f'{stage}: {report[stage]:.1f}ms' for stage in FaceDetectionPipeline.STAGES)
+        logging.info(f"[FACE EMOTION] Detection pipeline {report['frames']} frames ({report['skipped']} skipped, {report['fps']:.1f} fps) - {timings}")
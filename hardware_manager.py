@@ -158,14 +158,14 @@ class AudioManager:
     def bind(self, method, *args):
         self.callbacks.append((method, args))
 
-    def volumnUp(self):
-        self.mixer.setvolume(min(int(self.current_volume) + 10, 100))
+    def volumnUp(self, steps=1):
+        self.mixer.setvolume(min(int(self.current_volume) + 10 * steps, 100))
         self.current_volume = self.mixer.getvolume()[0]
         for method, args in self.callbacks:
             method(*args)
 
-    def volumnDown(self):
-        self.mixer.setvolume(max(int(self.current_volume) - 10, 0))
+    def volumnDown(self, steps=1):
+        self.mixer.setvolume(max(int(self.current_volume) - 10 * steps, 0))
         self.current_volume = self.mixer.getvolume()[0]
         for method, args in self.callbacks:
             method(*args)
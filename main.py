@@ -1,11 +1,15 @@
 from gc import callbacks
 import os
 import sys
+import logging
 import functools
 import datetime
+import threading
+import time
+import collections
+from concurrent.futures import Future
 from gi.repository import GObject as gobject
 
-from PyQt5 import sip
 from PyQt5.QtWidgets import QApplication, QWidget
 from PyQt5.QtWidgets import QLabel, QGroupBox, QPushButton, QMessageBox, QProgressBar
 from PyQt5.QtWidgets import QHBoxLayout, QVBoxLayout, QGridLayout  # Layouts
@@ -18,10 +22,10 @@ from PyQt5.QtCore import QThread
 
 from PyQt5.QtGui import QIcon, QFont, QImage, QPixmap, QFontDatabase
 
-from data_manager import vlc
-from data_manager import dataManagerInitListener
+from data_manager import dataManagerInitListener, startupTimeline
 from data_manager import WeatherDownloader, ScheduleDownloader, BluetoothController, AssistantManager, YouTubeMusicManager, SkinConditionUploader, StyleRecommendationManager
-from data_manager import changeSettings, saveSettings, getSettings, weekDay, lastDay, checkWifiConnection
+from data_manager import changeSettings, saveSettings, getSettings, weekDay, lastDay, connectivityMonitor
+from data_manager import cachesDirectoryPath, writeJsonAtomic, getFeature
 
 from hardware_manager import MoistureManager, AudioManager, ButtonManager
 
@@ -70,8 +74,9 @@ class AssistantThread(QThread):
         self.manager = AssistantManager()
     
     def run(self):
-        while not dataManagerInitListener.isInitialized():
-            continue
+        if not dataManagerInitListener.wait(['googleAssistantAuth']):  # blocks until assistant authentication is done
+            logging.error('[ASSISTANT] Device initialization failed: google assistant is not activated')
+            return
 
         self.manager.activate(self.acceptToken)
 
@@ -91,6 +96,317 @@ class AssistantThread(QThread):
             })
 
 
+# Data fetch workers
+#
+# Note:
+#   Runs network requests of the main window on QThreadPool so that GUI thread is never blocked
+#   Results are delivered to the GUI thread through 'fetched' signal with the key of the request
+
+class DataFetchSignals(QtCore.QObject):
+    fetched = QtCore.pyqtSignal(str, object)
+
+class DataFetchWorker(QtCore.QRunnable):
+    def __init__(self, key, method, *args) -> None:
+        super().__init__()
+        self.key = key
+        self.method = method
+        self.args = args
+        self.signals = DataFetchSignals()
+
+    def run(self):
+        try:
+            result = self.method(*self.args)
+        except Exception as error:
+            logging.error(f'[DATA FETCHER] Error occurred on fetching {self.key}: {error}')
+            result = None
+        self.signals.fetched.emit(self.key, result)
+
+class DataFetcher(QtCore.QObject):
+    fetched = QtCore.pyqtSignal(str, object)
+
+    def __init__(self, max_threads=4) -> None:
+        super().__init__()
+        self.pool = QtCore.QThreadPool()
+        self.pool.setMaxThreadCount(max_threads)
+        self.pool.setExpiryTimeout(-1)  # keep threads (and their google api connections) alive
+        self.pending = set()
+
+    def fetch(self, key, method, *args):
+        if key in self.pending:  # same request is already running
+            return
+        self.pending.add(key)
+
+        worker = DataFetchWorker(key, method, *args)
+        worker.signals.fetched.connect(self.acceptResult)
+        self.pool.start(worker)
+
+    @QtCore.pyqtSlot(str, object)
+    def acceptResult(self, key, result):
+        self.pending.discard(key)
+        self.fetched.emit(key, result)
+
+
+# Background jobs
+#
+# Note:
+#   Runs long actions (youtube search, face emotion detection ...) on QThreadPool and returns a Future
+#   Job method is called with the job as the first argument and reports progress with 'job.progress(value)'
+#   Only one job runs for each key: submitting a new job cancels the running job of the same key
+#   Cancelled jobs stop at the next 'job.progress' call and their 'onDone' callbacks are not called
+#   Progress and 'onDone' callbacks are delivered to the GUI thread through signals
+
+class JobCancelled(Exception):
+    pass
+
+class JobSignals(QtCore.QObject):
+    progressed = QtCore.pyqtSignal(object, int)
+    finished = QtCore.pyqtSignal(object)
+
+class Job(QtCore.QRunnable):
+    def __init__(self, key, method, args, onDone=None) -> None:
+        super().__init__()
+        self.key = key
+        self.method = method
+        self.args = args
+        self.onDone = onDone
+        self.future = Future()
+        self.signals = JobSignals()
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+        self.future.cancel()  # works only if the job is not started yet
+
+    def isCancelled(self):
+        return self._cancelled.is_set()
+
+    def progress(self, value):  # called on worker thread
+        if self.isCancelled():
+            raise JobCancelled()
+        self.signals.progressed.emit(self, value)
+
+    def run(self):
+        if not self.future.set_running_or_notify_cancel():
+            return
+        try:
+            self.future.set_result(self.method(self, *self.args))
+        except JobCancelled as error:
+            logging.info(f'[JOB EXECUTOR] Job {self.key} is cancelled')
+            self.future.set_exception(error)
+        except Exception as error:
+            logging.error(f'[JOB EXECUTOR] Error occurred on job {self.key}: {error}')
+            self.future.set_exception(error)
+        self.signals.finished.emit(self)
+
+class JobExecutor(QtCore.QObject):
+    progressed = QtCore.pyqtSignal(str, int)
+
+    def __init__(self, max_threads=2) -> None:
+        super().__init__()
+        self.pool = QtCore.QThreadPool()
+        self.pool.setMaxThreadCount(max_threads)
+        self.pool.setExpiryTimeout(-1)  # keep threads (and their google api connections) alive
+        self.jobs = {}  # key -> running job
+
+    def submit(self, key, method, *args, onDone=None):
+        self.cancel(key)  # newer command replaces the running one
+
+        job = Job(key, method, args, onDone)
+        job.signals.progressed.connect(self.acceptProgress)
+        job.signals.finished.connect(self.acceptFinished)
+        self.jobs[key] = job
+        self.pool.start(job)
+        return job.future
+
+    def cancel(self, key):
+        job = self.jobs.pop(key, None)
+        if job is not None:
+            job.cancel()
+
+    def isRunning(self, key):
+        return key in self.jobs
+
+    @QtCore.pyqtSlot(object, int)
+    def acceptProgress(self, job, value):
+        if not job.isCancelled():
+            self.progressed.emit(job.key, value)
+
+    @QtCore.pyqtSlot(object)
+    def acceptFinished(self, job):
+        if self.jobs.get(job.key) is job:
+            del self.jobs[job.key]
+        if job.isCancelled() or job.onDone is None:
+            return
+        job.onDone(job.future)
+
+
+# Action queue
+#
+# Note:
+#   Tokens of the main window are queued with the priority of the registered handler and handled one by one
+#   Coalescing rules for tokens waiting in the queue:
+#     * COALESCE_MERGE: consecutive tokens of the same type are merged ('count' key of the token is increased)
+#     * COALESCE_REPLACE: waiting token of the same type is replaced by the newer one
+#   Tokens of the same priority are handled in arrival order
+#   Actions that could not start within the timeout of the handler are dropped (e.g. 'music_next' pressed long ago)
+#   Timeout counts only the time the queue is free, not the time spent behind a running action
+#   Actions registered with NO_TIMEOUT are never dropped (e.g. paired volume tokens)
+
+class ActionHandler:
+    def __init__(self, method, priority, coalesce, timeout) -> None:
+        self.method = method
+        self.priority = priority
+        self.coalesce = coalesce
+        self.timeout = timeout
+
+class QueuedAction:
+    def __init__(self, token, handler, sequence) -> None:
+        self.token = token
+        self.method = handler.method
+        self.priority = handler.priority
+        self.timeout = handler.timeout
+        self.sequence = sequence
+        self.count = 1
+        self.queuedTime = time.perf_counter()
+
+class ActionQueue:
+    PRIORITY_HIGH = 0    # music commands (including searches), volume, assistant
+    PRIORITY_NORMAL = 1  # measurements, settings
+    PRIORITY_LOW = 2     # refresh
+
+    COALESCE_NONE = 0
+    COALESCE_MERGE = 1
+    COALESCE_REPLACE = 2
+
+    TIMEOUTS = {PRIORITY_HIGH: 10, PRIORITY_NORMAL: 120, PRIORITY_LOW: 60}  # default deadline of each priority (seconds)
+    NO_TIMEOUT = float('inf')
+
+    def __init__(self, maxsize=32) -> None:
+        self.maxsize = maxsize
+        self.handlers = {}
+        self.pending = []  # queued actions in arrival order
+        self.sequence = 0
+
+    def register(self, name, method, priority=PRIORITY_NORMAL, coalesce=COALESCE_NONE, timeout=None):
+        timeout = ActionQueue.TIMEOUTS[priority] if timeout is None else timeout
+        self.handlers[name] = ActionHandler(method, priority, coalesce, timeout)
+
+    def push(self, token):
+        handler = self.handlers.get(token['type'])
+        if handler is None:
+            logging.debug(f"[ACTION] No handler for action token: {token['type']}")  # e.g. sidebar mode changes
+            return False
+
+        token = dict(token)
+        if handler.coalesce == ActionQueue.COALESCE_MERGE and len(self.pending) > 0 and self.pending[-1].token['type'] == token['type']:
+            last = self.pending[-1]
+            last.count += 1
+            last.token['count'] = last.count
+            return True
+
+        queuedTime = None
+        if handler.coalesce == ActionQueue.COALESCE_REPLACE:
+            for action in self.pending:
+                if action.token['type'] == token['type']:
+                    self.pending.remove(action)
+                    queuedTime = action.queuedTime  # latency is measured from the first request
+                    break
+
+        if len(self.pending) >= self.maxsize:
+            logging.warning(f"[ACTION] Action queue is full: {token['type']} is dropped")
+            return False
+
+        self.sequence += 1
+        action = QueuedAction(token, handler, self.sequence)
+        if queuedTime is not None:
+            action.queuedTime = queuedTime
+        self.pending.append(action)
+        return True
+
+    def pop(self):
+        action = min(self.pending, key=lambda action: (action.priority, action.sequence))
+        self.pending.remove(action)
+        return action
+
+    def __len__(self):
+        return len(self.pending)
+
+
+# Action context
+#
+# Note:
+#   Execution context of one action, passed to the handler with the token
+#   Connection state is read once from the connectivity monitor when the action starts
+#   (handlers use this snapshot instead of checking the connection again)
+#   Deadline of the action is counted from the time the action is able to start
+#   (queued time, or the end of the previous action if the queue was busy)
+
+class ActionContext:
+    def __init__(self, action, readyTime) -> None:
+        self.token = action.token
+        self.queuedTime = action.queuedTime
+        self.deadline = max(action.queuedTime, readyTime) + action.timeout
+        self.online = connectivityMonitor.isConnected()
+        self.linkState = connectivityMonitor.linkState  # interfaces which have carrier (None if unknown)
+        self.checkedTime = connectivityMonitor.checkedTime
+
+    def elapsed(self):
+        return time.perf_counter() - self.queuedTime
+
+    def remaining(self):
+        return max(self.deadline - time.perf_counter(), 0.0)
+
+    def expired(self):
+        return time.perf_counter() >= self.deadline
+
+
+# Action metrics
+#
+# Note:
+#   Keeps latency of recent actions for each token type
+#     * wait: time from queueing to the start of the handler
+#     * run: running time of the handler (including modal dialogs)
+#   Exported to 'caches/action_metrics.json' on every refresh of the main window
+
+class ActionMetrics:
+    def __init__(self, size=100) -> None:
+        self.samples = collections.defaultdict(lambda: collections.deque(maxlen=size))  # type -> (wait, run)
+        self.counts = collections.Counter()     # handled actions
+        self.coalesced = collections.Counter()  # tokens merged into other actions
+        self.expired = collections.Counter()    # actions dropped after the deadline
+
+    def record(self, name, wait, run, count=1):
+        self.samples[name].append((wait, run))
+        self.counts[name] += 1
+        self.coalesced[name] += count - 1
+        logging.debug(f'[ACTION] {name} waited {wait * 1000:.1f}ms, ran {run * 1000:.1f}ms')
+
+    def recordExpired(self, name):
+        self.expired[name] += 1
+
+    def report(self):
+        report = {name: {'count': 0, 'expired': count} for name, count in self.expired.items()}
+        for name, samples in self.samples.items():
+            waits = sorted(wait for wait, _ in samples)
+            runs = sorted(run for _, run in samples)
+            report[name] = {
+                'count': self.counts[name],
+                'coalesced': self.coalesced[name],
+                'expired': self.expired[name],
+                'wait_mean_ms': round(sum(waits) / len(waits) * 1000, 1),
+                'wait_max_ms': round(waits[-1] * 1000, 1),
+                'run_mean_ms': round(sum(runs) / len(runs) * 1000, 1),
+                'run_p90_ms': round(runs[min(int(len(runs) * 0.9), len(runs) - 1)] * 1000, 1),
+            }
+        return report
+
+    def export(self, path):
+        try:
+            writeJsonAtomic(path, self.report())
+        except Exception as error:
+            logging.warning(f'[ACTION] Cannot export action metrics: {error}')
+
+
 # Bluetooth thread
 #
 # Note:
@@ -152,6 +468,7 @@ class MusicPlayerModule(object):
         self.parent = parent
         self.manager = YouTubeMusicManager()
 
+        self.data = None
         self.widget = None
         self.manager.bindCallback(self.refresh)
         self.title_widget = None
@@ -175,7 +492,7 @@ class MusicPlayerModule(object):
         
         music_title = 'Music player'
         if self.manager.current_playlist is not None and self.manager.current_index is not None:
-            music_title = self.manager.current_playlist[self.manager.current_index]['snippet']['title']
+            music_title = self.manager.current_playlist[self.manager.current_index]['title']
         
         self.title_widget = QLabel(music_title)
         self.title_widget.setStyleSheet(labelDefaultStyleSheet + 
@@ -198,6 +515,7 @@ class MusicPlayerModule(object):
             self.play_button_widget.setIcon(QIcon(button_play))
         self.play_button_signal_connected = True
         self.play_button_widget.setIconSize(QtCore.QSize(50, 50))
+        self.data = (music_title, self.manager.isPlaying())
 
         next_button_widget = QPushButton()
         next_button_widget.setStyleSheet(f'border-style: none')
@@ -223,24 +541,38 @@ class MusicPlayerModule(object):
         self.widget.setLayout(self.layout)
 
     def refresh(self):
-        music_title = 'Music player'
-        if self.manager.current_playlist is not None and self.manager.current_index is not None:
-            music_title = self.manager.current_playlist[self.manager.current_index]['snippet']['title']
+        self.update()
+
+    def update(self, data=None):
+        # data: (music title, playing flag), current state of the manager is used if data is None
+        if data is None:
+            music_title = 'Music player'
+            if self.manager.current_playlist is not None and self.manager.current_index is not None:
+                music_title = self.manager.current_playlist[self.manager.current_index]['title']
+            data = (music_title, self.manager.isPlaying())
+        if data == self.data:
+            return False
+
+        music_title, playing = data
         self.title_widget.setText(music_title)
 
-        self.disconnectPlayButtonSignal()
-        if self.manager.isPlaying():
-            self.play_button_widget.clicked.connect(self.manager.pause)
-            self.play_button_widget.setIcon(QIcon(button_pause))
-        else:
-            self.play_button_widget.clicked.connect(self.manager.play)
-            self.play_button_widget.setIcon(QIcon(button_play))
-        self.play_button_signal_connected = True
+        if self.data is None or self.data[1] != playing:  # reconnect play button only if the state is changed
+            self.disconnectPlayButtonSignal()
+            if playing:
+                self.play_button_widget.clicked.connect(self.manager.pause)
+                self.play_button_widget.setIcon(QIcon(button_pause))
+            else:
+                self.play_button_widget.clicked.connect(self.manager.play)
+                self.play_button_widget.setIcon(QIcon(button_play))
+            self.play_button_signal_connected = True
+
+        self.data = data
+        return True
 
     def currentMusicTitle(self):
         music_title = 'default'
         if self.manager.current_playlist is not None and self.manager.current_index is not None:
-            music_title = self.manager.current_playlist[self.manager.current_index]['snippet']['title']
+            music_title = self.manager.current_playlist[self.manager.current_index]['title']
         return music_title
 
 
@@ -363,6 +695,303 @@ class SidebarModule:
         # })
 
 
+# Weather Panel
+#
+# Note:
+#   Weather widget of the main window
+#   Widgets are generated only once and 'update' method changes the contents of them
+
+class WeatherPanel(object):
+    def __init__(self) -> None:
+        self.data = None
+        self.iconData = None
+        self.widget = None
+        self.drawWindow()
+
+    def drawWindow(self):
+        self.widget = QGroupBox()
+        self.widget.setFixedWidth(190)
+        self.widget.setFixedHeight(240)
+        self.widget.setStyleSheet(widgetDefaultStyleSheet)
+
+        # Placeholder is shown until the first download is finished
+        self.placeholderWidget = QLabel("날씨 데이터를 불러오는 중입니다")
+        self.placeholderWidget.setAlignment(Qt.AlignCenter)
+        self.placeholderWidget.setWordWrap(True)
+        self.placeholderWidget.setStyleSheet(labelDefaultStyleSheet + 'font-size: 10pt; font-weight: bold; color: white;')
+
+        # Generate weather subwidgets
+        self.weatherIconWidget = QLabel()
+        self.cityNameWidget = QLabel()
+        self.temperatureWidget = QLabel()
+        self.minMaxTemperatureWidget = QLabel()
+        self.humidityWidget = QLabel()
+        self.refreshedTimeWidget = QLabel()
+
+        # Set style of generated sub widgets
+        self.cityNameWidget.setStyleSheet(labelDefaultStyleSheet + 'font-size: 10pt; font-weight: bold; color: white;')
+        self.temperatureWidget.setStyleSheet(labelDefaultStyleSheet + 'font-size: 10pt; font-weight: bold; color: white;')
+        self.humidityWidget.setStyleSheet(labelDefaultStyleSheet + 'font-size: 10pt; font-weight: bold; color: white;')
+        self.minMaxTemperatureWidget.setStyleSheet(labelDefaultStyleSheet + 'font-size: 8pt; font-weight: bold; color: white;')
+        self.refreshedTimeWidget.setStyleSheet(labelDefaultStyleSheet + 'font-size: 8pt; font-weight: normal;  color: white;')
+        self.weatherIconWidget.setStyleSheet('border-style: none')
+
+        self.dataWidgets = [
+            self.weatherIconWidget, self.cityNameWidget, self.temperatureWidget,
+            self.minMaxTemperatureWidget, self.humidityWidget, self.refreshedTimeWidget,
+        ]
+
+        # Generate layouts for subwidgets
+        vbox = QVBoxLayout()
+        vbox.addWidget(self.placeholderWidget)
+        for widget in self.dataWidgets:
+            widget.hide()
+            vbox.addWidget(widget)
+        vbox.setContentsMargins(20, 0, 20, 20)
+        self.widget.setLayout(vbox)
+
+    def update(self, data):
+        # data: {'weather': (openweathermap response), 'icon': (icon image), 'refreshedTime': (QTime)}
+        if data is None or data == self.data:
+            return False
+
+        weatherDataJson = data['weather']
+        self.cityNameWidget.setText(f"{str(weatherDataJson.get('name'))}")
+        self.temperatureWidget.setText(f"현재기온 {str(weatherDataJson.get('main').get('temp'))}°C")
+        self.minMaxTemperatureWidget.setText(f"(최소 {str(weatherDataJson.get('main').get('temp_min'))}°C 최대 {str(weatherDataJson.get('main').get('temp_max'))}°C)")
+        self.humidityWidget.setText(f"습도 {str(weatherDataJson.get('main').get('humidity'))}%")
+        self.refreshedTimeWidget.setText(f"{data['refreshedTime'].toString('hh:mm:ss')}에 새로고침 됨")
+
+        if data['icon'] and data['icon'] != self.iconData:  # decode icon image only if it is changed
+            weatherIconImage = QImage()
+            weatherIconImage.loadFromData(data['icon'])
+            weatherIconPixmap = QPixmap(weatherIconImage)
+            weatherIconPixmap.scaledToHeight(64)
+            self.weatherIconWidget.setPixmap(weatherIconPixmap)
+            self.iconData = data['icon']
+
+        if self.data is None:
+            self.placeholderWidget.hide()
+            for widget in self.dataWidgets:
+                widget.show()
+
+        self.data = data
+        return True
+
+    def showError(self):
+        # last downloaded data is kept on the panel if there is any
+        if self.data is None:
+            self.placeholderWidget.setText("날씨 데이터 다운로드에 문제가 발생하였습니다")
+
+
+# Schedule Panel
+#
+# Note:
+#   Schedule widget of the main window
+#   Labels for schedules are reused and only the labels that are not enough are generated
+
+class SchedulePanel(object):
+    def __init__(self) -> None:
+        self.data = None
+        self.widget = None
+        self.scheduleLabels = []
+        self.drawWindow()
+
+    def drawWindow(self):
+        self.widget = QGroupBox()
+        self.widget.setFixedWidth(190)
+        self.widget.setStyleSheet(widgetDefaultStyleSheet)
+
+        self.titleLabel = QLabel("일정을 추가하세요")
+        self.titleLabel.setStyleSheet(labelDefaultStyleSheet + 
+            'color: white; font-size: 11pt; font-weight: bold; border-style: none;')
+
+        self.layout = QVBoxLayout()
+        self.layout.addWidget(self.titleLabel)
+        self.layout.setContentsMargins(20, 20, 20, 20)
+        self.layout.addStretch(1)
+        self.widget.setLayout(self.layout)
+
+    def update(self, data):
+        # data: list of [schedule name, done flag('1' if done)]
+        if data is None or data == self.data:
+            return False
+
+        schedules = [schedule for schedule in data if len(schedule) >= 2]
+        self.titleLabel.setText("일정" if len(schedules) > 0 else "일정을 추가하세요")
+
+        while len(self.scheduleLabels) < len(schedules):
+            label = QLabel()
+            self.layout.insertWidget(len(self.scheduleLabels) + 1, label)  # insert before stretch
+            self.scheduleLabels.append(label)
+
+        for idx, label in enumerate(self.scheduleLabels):
+            if idx >= len(schedules):
+                label.hide()
+                continue
+
+            schedule = schedules[idx]
+            label.setText(schedule[0])
+            if schedule[1] == '1':
+                label.setStyleSheet(labelDefaultStyleSheet + 
+                    'color: white; font-size: 10pt; font-weight: bold; text-decoration: line-through;')
+            else:
+                label.setStyleSheet(labelDefaultStyleSheet + 
+                    'color: white; font-size: 10pt; font-weight: bold; border-style: none;')
+            label.show()
+
+        self.data = data
+        return True
+
+    def showError(self):
+        # last downloaded schedules are kept on the panel if there are any
+        if self.data is None:
+            self.titleLabel.setText("일정 데이터 다운로드에 문제가 발생하였습니다")
+            self.titleLabel.setWordWrap(True)
+
+
+# Calendar Panel
+#
+# Note:
+#   Calendar widget of the main window
+#   Grid of day labels (6 weeks) is generated only once and redrawn when the date is changed
+
+class CalendarPanel(object):
+    weekdayNames = ['일', '월', '화', '수', '목', '금', '토']
+
+    def __init__(self) -> None:
+        self.data = None
+        self.widget = None
+        self.dayLabels = []
+        self.drawWindow()
+        self.update(QDate.currentDate())
+
+    def drawWindow(self):
+        self.widget = QGroupBox()
+        self.widget.setFixedWidth(190)
+        self.widget.setFixedHeight(240)
+        self.widget.setStyleSheet(widgetDefaultStyleSheet)
+
+        # Generate calender layouts
+        vbox = QVBoxLayout()  # main layout
+        vbox.addStretch(1)
+
+        # 1. Layout for calender header
+        self.calenderHeaderLabel = QLabel()
+        self.calenderHeaderLabel.setStyleSheet(labelDefaultStyleSheet + 'font-size: 11pt; font-weight: bold; color: white;')
+        headerLayout = QHBoxLayout()
+        headerLayout.addStretch(1)
+        headerLayout.addWidget(self.calenderHeaderLabel)
+        headerLayout.addStretch(1)
+        vbox.addStretch(1)
+        vbox.addLayout(headerLayout)
+        vbox.addStretch(1)
+
+        # 2. Layout for weekdays
+        calenderBodyGridLayout = QGridLayout()
+
+        for cidx, name in enumerate(CalendarPanel.weekdayNames):
+            lbl = QLabel(name)
+            if cidx == 0:
+                lbl.setStyleSheet(labelDefaultStyleSheet + 'font-size: 9pt; font-weight: bold; color: red;')
+            else:
+                lbl.setStyleSheet(labelDefaultStyleSheet + 'font-size: 9pt; font-weight: bold; color: white;')
+            calenderBodyGridLayout.addWidget(lbl, 0, cidx)
+
+        # 3. Layout for calender body (labels are filled by 'update' method)
+        for ridx in range(1, 7):
+            for cidx in range(7):
+                lbl = QLabel()
+                calenderBodyGridLayout.addWidget(lbl, ridx, cidx)
+                self.dayLabels.append(lbl)
+
+        calenderBodyLayout = QHBoxLayout()
+        calenderBodyLayout.addStretch(1)
+        calenderBodyLayout.addLayout(calenderBodyGridLayout)
+        calenderBodyLayout.addStretch(1)
+        vbox.addLayout(calenderBodyLayout)
+        vbox.addStretch(1)
+        vbox.setContentsMargins(20, 0, 20, 20)
+        self.widget.setLayout(vbox)
+
+    def update(self, data):
+        # data: QDate of today
+        if data is None or data == self.data:
+            return False
+
+        targetMonth = data.month()
+        targetYear = data.year()
+        self.calenderHeaderLabel.setText(f'{targetYear}년 {targetMonth}월')
+
+        offset = weekDay(targetYear, targetMonth, 1)
+        for idx, lbl in enumerate(self.dayLabels):
+            targetDay = idx - offset + 1
+            if targetDay < 1 or targetDay > lastDay(targetYear, targetMonth):
+                lbl.setText('')
+                lbl.setStyleSheet(labelDefaultStyleSheet)
+                continue
+
+            lbl.setText(str(targetDay))
+            if idx % 7 == 0:
+                lbl.setStyleSheet(labelDefaultStyleSheet + 'font-size: 9pt; font-weight: bold; color: red;')
+            elif data.day() == targetDay:
+                lbl.setStyleSheet(labelDefaultStyleSheet + 'font-size: 9pt; font-weight: bold; color: black; background-color: white;')
+            else:
+                lbl.setStyleSheet(labelDefaultStyleSheet + 'font-size: 9pt; font-weight: bold; color: white;')
+
+        self.data = data
+        return True
+
+
+# Assistant Panel
+#
+# Note:
+#   Google assistant widget of the main window (trigger button and message label)
+
+class AssistantPanel(object):
+    def __init__(self, trigger) -> None:
+        self.data = 'Google Assistant'
+        self.widget = None
+        self.trigger = trigger  # method called when the assistant button is clicked
+        self.drawWindow()
+
+    def drawWindow(self):
+        self.widget = QGroupBox()
+        self.widget.setFixedHeight(60)
+        self.widget.setFixedWidth(440)
+        self.widget.setStyleSheet(widgetDefaultStyleSheet)
+
+        self.msgLabel = QLabel(self.data)
+        self.msgLabel.setStyleSheet(labelDefaultStyleSheet + 
+            'color: white; font-size: 11pt; font-weight: bold; border-style: none;')
+        self.triggerWidget = QPushButton()
+        self.triggerWidget.setStyleSheet(f'border-style: none')
+        self.triggerWidget.clicked.connect(self.trigger)
+        self.triggerWidget.setIcon(QIcon(assistant_logo))
+        self.triggerWidget.setIconSize(QtCore.QSize(30, 30))
+
+        vbox = QVBoxLayout()
+        vbox.addStretch(1)
+
+        hbox = QHBoxLayout()
+        hbox.addWidget(self.triggerWidget)
+        hbox.addWidget(self.msgLabel)
+        hbox.addStretch(1)
+
+        vbox.addLayout(hbox)
+        vbox.addStretch(1)
+        self.widget.setLayout(vbox)
+
+    def update(self, data):
+        # data: message string
+        if data is None or data == self.data:
+            return False
+
+        self.msgLabel.setText(data)
+        self.data = data
+        return True
+
+
 class AlertDialog(QMessageBox):
     def __init__(self, title, msg, timeout=3, parent=None):
         super(AlertDialog, self).__init__(parent)
@@ -394,14 +1023,17 @@ class AlertDialog(QMessageBox):
 #   Indicates information about current datetime, scheudles, weather ...
 
 class MyApp(QWidget):
+    connectivityChanged = QtCore.pyqtSignal(bool)
+
     def __init__(self):
         super().__init__()
 
-        # Global variables
-        self.actionValid = True  # take action validity flag
-        self.cachedWeather = None
-        self.cachedWeatherIconImg = None
-        self.cachedSchedule = None
+        # Action queue (tokens from bluetooth, assistant, sidebar and hardware buttons)
+        self.actionQueue = ActionQueue()
+        self.actionMetrics = ActionMetrics()
+        self.actionRunning = False
+        self.actionFinishedTime = time.perf_counter()  # end of the last action (deadlines start after this)
+        self.registerActions()
 
         # Global modules
         self.refreshedTime = QTime.currentTime()
@@ -413,6 +1045,12 @@ class MyApp(QWidget):
         self.audioModule = AudioManager()
         self.skinConditionUploader = SkinConditionUploader()
         self.styleRecommendationManager = StyleRecommendationManager()
+        self.dataFetcher = DataFetcher()
+        self.dataFetcher.fetched.connect(self.acceptFetchedData)
+        self.connectivityChanged.connect(self.acceptConnectivityChange)
+        connectivityMonitor.bind(self.connectivityChanged.emit)  # called from the monitor thread
+        self.jobExecutor = JobExecutor()
+        self.jobExecutor.progressed.connect(self.acceptJobProgress)
 
         # Bind callbacks to modules
         self.musicPlayerModule.bind(self.autoSendMetadata)
@@ -446,14 +1084,12 @@ class MyApp(QWidget):
         self.assistantThread = AssistantThread()
         self.assistantThread.start()
         self.assistantThread.threadEvent.connect(self.takeAction)
-        self.assistantMsgLabel = QLabel('Google Assistant')
-        self.assistantMsgLabel.setStyleSheet(labelDefaultStyleSheet + 
-            'color: white; font-size: 11pt; font-weight: bold; border-style: none;')
-        self.assistant_trigger_widget = QPushButton()
-        self.assistant_trigger_widget.setStyleSheet(f'border-style: none')
-        self.assistant_trigger_widget.clicked.connect(self.assistantThread.trigger)
-        self.assistant_trigger_widget.setIcon(QIcon(assistant_logo))
-        self.assistant_trigger_widget.setIconSize(QtCore.QSize(30, 30))
+
+        # Panels of the main window (each panel owns its widgets)
+        self.weatherPanel = WeatherPanel()
+        self.schedulePanel = SchedulePanel()
+        self.calendarPanel = CalendarPanel()
+        self.assistantPanel = AssistantPanel(trigger=self.assistantThread.trigger)
 
         # Generate main window layout and show that in full screen
         self.scheduleWidget = None     # schedule widget
@@ -465,16 +1101,17 @@ class MyApp(QWidget):
         self.progressbarWidget = None  # progressbar widget
         self.mainLayout = None
         self.drawWindow()  # generate main layout and set widget layout as main layout
+        self.fetchData()   # request network data (panels are filled when the results arrive)
 
         self.showFullScreen()
         # self.show()
 
     def drawWindow(self):
         # Required widget
-        self.scheduleWidget = self.generateScheduleWidget()
-        self.assistantWidget = self.generateAssistantWidget()
-        self.weatherWidget = self.generateWeatherWidget()
-        self.calendarWidget = self.generateCalenderWidget()
+        self.scheduleWidget = self.schedulePanel.widget
+        self.assistantWidget = self.assistantPanel.widget
+        self.weatherWidget = self.weatherPanel.widget
+        self.calendarWidget = self.calendarPanel.widget
         self.playerWidget = self.generateMusicPlayerWidget()
         self.sidebarWidget = self.generateSidebarWidget()
         self.progressbarWidget = self.generateProgressbarWidget()
@@ -517,10 +1154,81 @@ class MyApp(QWidget):
 
         self.setLayout(self.mainLayout)
 
+    def fetchData(self):
+        self.dataFetcher.fetch('weather', self.downloadWeather)
+        self.dataFetcher.fetch('schedule', self.scheduleDownloader.download, QDate.currentDate().toString('yyyy-MM-dd'))
+
+    def downloadWeather(self):  # called on worker thread
+        weatherDataJson = self.weatherDownloader.download()
+        if not weatherDataJson['valid']:
+            return None
+        weatherIconData = self.weatherDownloader.downloadWeatherIcon(str(weatherDataJson.get('weather')[0].get('icon')))
+        return {'weather': weatherDataJson, 'icon': weatherIconData}
+
+    def acceptFetchedData(self, key, result):
+        # failed data is fetched again when the connection comes back (see acceptConnectivityChange)
+        if key == 'weather' and result is not None:
+            result['refreshedTime'] = self.refreshedTime
+            self.weatherPanel.update(result)
+        elif key == 'weather':
+            self.weatherPanel.showError()
+
+        elif key == 'schedule' and result is not None:
+            self.schedulePanel.update(result)
+        elif key == 'schedule':
+            self.schedulePanel.showError()
+
+        if len(self.dataFetcher.pending) == 0:
+            self.progressbarWidget.setValue(100)
+
+    def acceptConnectivityChange(self, connected):
+        if connected:  # fetch again the data that could not be downloaded while offline
+            self.fetchData()
+
+    def acceptJobProgress(self, key, value):
+        self.progressbarWidget.setValue(value)
+
+    # Music search jobs only fetch playlists on worker threads
+    # Player and widgets are changed by the 'onDone' callbacks on the GUI thread (not called if cancelled)
+    def searchMusic(self, job, query):  # called on worker thread
+        job.progress(10)
+        playlist = self.musicPlayerModule.manager.fetchPlaylist(query)
+        job.progress(90)
+        return playlist
+
+    def searchMusicByEmotion(self, job):  # called on worker thread
+        job.progress(10)
+        result = self.musicPlayerModule.manager.searchByEmotion(cancelled=job.isCancelled)
+        job.progress(90)
+        return result
+
+    def acceptMusicSearched(self, future):
+        self.progressbarWidget.setValue(100)
+        playlist = future.result() if future.exception() is None else None
+        if playlist is None:
+            self.assistantPanel.update('음악을 검색하지 못했습니다')
+            return
+        self.musicPlayerModule.manager.setPlaylist(playlist)
+        self.musicPlayerModule.manager.play()
+
+    def acceptMusicSearchedByEmotion(self, future):
+        self.progressbarWidget.setValue(100)
+        result_valid, playlist = future.result() if future.exception() is None else (None, None)
+        msg = "표정 분석에 실패했습니다"
+
+        if result_valid and result_valid != 'invalid' and playlist is not None:
+            self.musicPlayerModule.manager.setPlaylist(playlist)
+            self.musicPlayerModule.manager.play()
+            msg=f"현재 감정 상태: {result_valid}\n적절한 음악을 재생합니다"
+
+        alertDialog = AlertDialog(title='표정 분석', msg=msg, timeout=5, parent=self)
+        alertDialog.exec_()
+
     def showTime(self):
         currentTime = QTime.currentTime().toString('hh:mm')
         currentDate = QDate.currentDate().toString('yyyy-MM-dd dddd')
         self.dateTimeWidget.setText(f'{currentDate} {currentTime}')  # change timeWidget
+        self.calendarPanel.update(QDate.currentDate())  # redrawn only if the date is changed
 
         refreshTerm = getSettings('refresh_term')
         if (self.refreshedTime.secsTo(QTime.currentTime()) // 60) >= refreshTerm:
@@ -568,216 +1276,12 @@ class MyApp(QWidget):
 
         return groupbox
 
-    def generateAssistantWidget(self):
-        groupbox = QGroupBox()
-        groupbox.setFixedHeight(60)
-        groupbox.setFixedWidth(440)
-        groupbox.setStyleSheet(widgetDefaultStyleSheet)
-
-        vbox = QVBoxLayout()
-        vbox.addStretch(1)
-
-        hbox = QHBoxLayout()
-        # hbox.addStretch(1)
-        hbox.addWidget(self.assistant_trigger_widget)
-        hbox.addWidget(self.assistantMsgLabel)
-        hbox.addStretch(1)
-        
-        vbox.addLayout(hbox)
-        vbox.addStretch(1)
-        groupbox.setLayout(vbox)
-
-        return groupbox
-        
-    def generateScheduleWidget(self):
-        groupbox = QGroupBox()
-        groupbox.setFixedWidth(190)
-        groupbox.setStyleSheet(widgetDefaultStyleSheet)
-
-        try:
-            scheduleDataList = self.scheduleDownloader.download(QDate.currentDate().toString('yyyy-MM-dd'))
-            self.cachedSchedule = scheduleDataList
-        except:
-            scheduleDataList = self.cachedSchedule
-
-        titleLabel = QLabel("일정" if len(scheduleDataList) > 0 else "일정을 추가하세요")
-        titleLabel.setStyleSheet(labelDefaultStyleSheet + 
-            'color: white; font-size: 11pt; font-weight: bold; border-style: none;')
-
-        labels = [titleLabel]
-        for schedule in scheduleDataList:
-            label = QLabel(schedule[0])
-            if schedule[1] == '1':
-                label.setStyleSheet(labelDefaultStyleSheet + 
-                    'color: white; font-size: 10pt; font-weight: bold; text-decoration: line-through;')
-            else:
-                label.setStyleSheet(labelDefaultStyleSheet + 
-                    'color: white; font-size: 10pt; font-weight: bold; border-style: none;')
-            labels.append(label)
-
-        vbox = QVBoxLayout()
-        if len(scheduleDataList) == 0:
-            vbox.setAlignment(Qt.AlignCenter)
-            vbox.addStretch(1)
-        for widget in labels:
-            vbox.addWidget(widget)
-        vbox.setContentsMargins(20, 20, 20, 20)
-        vbox.addStretch(1)
-        groupbox.setLayout(vbox)
-
-        return groupbox
-
-    def generateWeatherWidget(self):
-        groupbox = QGroupBox()
-        groupbox.setFixedWidth(190)
-        groupbox.setFixedHeight(240)
-        groupbox.setStyleSheet(widgetDefaultStyleSheet)
-
-        # Download weather data
-        try:
-            weatherDataJson = self.weatherDownloader.download()
-            if weatherDataJson['valid']:
-                self.cachedWeather = weatherDataJson
-            else:
-                weatherDataJson = self.cachedWeather
-        except:
-            vbox = QVBoxLayout()
-            vbox.addStretch(1)
-
-            hbox = QHBoxLayout()
-            warning_text = QLabel("날씨 데이터 다운로드에 문제가 발생하였습니다")
-            warning_text.setStyleSheet(labelDefaultStyleSheet + 'font-size: 10pt; font-weight: bold; color: white;')
-            hbox.addStretch(1)
-            hbox.addWidget(warning_text)
-            hbox.addStretch(1)
-
-            vbox.addLayout(hbox)
-            vbox.addStretch(1)
-            groupbox.setLayout(vbox)
-            return groupbox
-
-        # Generate weather subwidgets
-        cityNameWidget = QLabel(f"{str(weatherDataJson.get('name'))}")
-        temperatureWidget = QLabel(f"현재기온 {str(weatherDataJson.get('main').get('temp'))}°C")
-        minMaxTemperatureWidget = QLabel(f"(최소 {str(weatherDataJson.get('main').get('temp_min'))}°C 최대 {str(weatherDataJson.get('main').get('temp_max'))}°C)")
-        humidityWidget = QLabel(f"습도 {str(weatherDataJson.get('main').get('humidity'))}%")
-        refreshedTimeWidget = QLabel(f"{self.refreshedTime.toString('hh:mm:ss')}에 새로고침 됨")
-
-        # Generate weather icon widget
-        weatherIconImage = QImage()
-        if checkWifiConnection():
-            weatherIconData = self.weatherDownloader.downloadWeatherIcon(str(weatherDataJson.get('weather')[0].get('icon')))
-            self.cachedWeatherIconImg = weatherIconData
-        else:
-            weatherIconData = self.cachedWeatherIconImg
-        weatherIconImage.loadFromData(weatherIconData)
-        weatherIconPixmap = QPixmap(weatherIconImage)
-        weatherIconPixmap.scaledToHeight(64)
-        weatherIconwidget = QLabel()
-        weatherIconwidget.setPixmap(weatherIconPixmap)
-
-        # Set style of generated sub widgets
-        cityNameWidget.setStyleSheet(labelDefaultStyleSheet + 'font-size: 10pt; font-weight: bold; color: white;')
-        temperatureWidget.setStyleSheet(labelDefaultStyleSheet + 'font-size: 10pt; font-weight: bold; color: white;')
-        humidityWidget.setStyleSheet(labelDefaultStyleSheet + 'font-size: 10pt; font-weight: bold; color: white;')
-        minMaxTemperatureWidget.setStyleSheet(labelDefaultStyleSheet + 'font-size: 8pt; font-weight: bold; color: white;')
-        refreshedTimeWidget.setStyleSheet(labelDefaultStyleSheet + 'font-size: 8pt; font-weight: normal;  color: white;')
-        weatherIconwidget.setStyleSheet('border-style: none')
-
-        # Generate layouts fo subwidgets and return weather widget
-        vbox = QVBoxLayout()
-        vbox.addWidget(weatherIconwidget)
-        vbox.addWidget(cityNameWidget)
-        vbox.addWidget(temperatureWidget)
-        vbox.addWidget(minMaxTemperatureWidget)
-        vbox.addWidget(humidityWidget)
-        vbox.addWidget(refreshedTimeWidget)
-        vbox.setContentsMargins(20, 0, 20, 20)
-        groupbox.setLayout(vbox)
-
-        return groupbox
-
-    def generateCalenderWidget(self):
-        groupbox = QGroupBox()
-        groupbox.setFixedWidth(190)
-        groupbox.setFixedHeight(240)
-        groupbox.setStyleSheet(widgetDefaultStyleSheet)
-        
-        today = QDate.currentDate()
-        targetMonth = today.month()
-        targetYear = today.year()
-
-        # Generate calender layouts
-        vbox = QVBoxLayout()  # main layout
-        vbox.addStretch(1)
-        
-        # 1. Layout for calender header
-        calenderHeaderLabel = QLabel(f'{targetYear}년 {targetMonth}월')
-        calenderHeaderLabel.setStyleSheet(labelDefaultStyleSheet + 'font-size: 11pt; font-weight: bold; color: white;')
-        headerLayout = QHBoxLayout()
-        headerLayout.addStretch(1)
-        headerLayout.addWidget(calenderHeaderLabel)
-        headerLayout.addStretch(1)
-        vbox.addStretch(1)
-        vbox.addLayout(headerLayout)
-        vbox.addStretch(1)
-        
-        # 2. Layout for weekdays
-        calenderBodyGridLayout = QGridLayout()
-        weekdayNames = ['일', '월', '화', '수', '목', '금', '토']
-
-        for cidx, name in enumerate(weekdayNames):
-            lbl = QLabel(name)
-            if cidx == 0:
-                lbl.setStyleSheet(labelDefaultStyleSheet + 'font-size: 9pt; font-weight: bold; color: red;')
-            else:
-                lbl.setStyleSheet(labelDefaultStyleSheet + 'font-size: 9pt; font-weight: bold; color: white;')
-            calenderBodyGridLayout.addWidget(lbl, 0, cidx)
-
-        # 3. Layout for calender body
-        ridx, cidx = 1, weekDay(targetYear, targetMonth, 1)
-        
-        for targetDay in range(1, lastDay(targetYear, targetMonth)+1):  
-            lbl = QLabel(str(targetDay))
-            if cidx == 0:
-                lbl.setStyleSheet(labelDefaultStyleSheet + 'font-size: 9pt; font-weight: bold; color: red;')
-            elif QDate.currentDate() == QDate(targetYear, targetMonth, targetDay):
-                lbl.setStyleSheet(labelDefaultStyleSheet + 'font-size: 9pt; font-weight: bold; color: black; background-color: white;')
-            else:
-                lbl.setStyleSheet(labelDefaultStyleSheet + 'font-size: 9pt; font-weight: bold; color: white;')
-            calenderBodyGridLayout.addWidget(lbl, ridx, cidx)
-            cidx += 1
-            
-            if cidx == 7:
-                ridx += 1
-                cidx = 0
-        
-        calenderBodyLayout = QHBoxLayout()
-        calenderBodyLayout.addStretch(1)
-        calenderBodyLayout.addLayout(calenderBodyGridLayout)
-        calenderBodyLayout.addStretch(1)
-        vbox.addLayout(calenderBodyLayout)
-        vbox.addStretch(1)
-        vbox.setContentsMargins(20, 0, 20, 20)
-        groupbox.setLayout(vbox)
-
-        return groupbox
-
-    def deleteLayout(self, cur_lay):
-        if cur_lay is not None:
-            while cur_lay.count():
-                item = cur_lay.takeAt(0)
-                widget = item.widget()
-                if widget is not None:
-                    widget.setParent(None)
-                else:
-                    self.deleteLayout(item.layout())
-            sip.delete(cur_lay)
-
     def refresh(self):
         self.refreshedTime = QTime.currentTime()
-        self.deleteLayout(self.mainLayout)  # remove main layout
-        self.drawWindow()  # regenerate main layout and set widget layout as main layout
+        self.calendarPanel.update(QDate.currentDate())
+        self.musicPlayerModule.update()
+        self.fetchData()  # weather and schedule panels are updated when the results arrive
+        self.actionMetrics.export(os.path.join(cachesDirectoryPath, 'action_metrics.json'))
 
     def setMetaData(self):
         self.metadata.music_title = self.musicPlayerModule.currentMusicTitle()
@@ -792,255 +1296,277 @@ class MyApp(QWidget):
     def takeThreadAction(self, token):
         self.takeAction(token)
 
+    def registerActions(self):
+        high, normal, low = ActionQueue.PRIORITY_HIGH, ActionQueue.PRIORITY_NORMAL, ActionQueue.PRIORITY_LOW
+        merge, replace = ActionQueue.COALESCE_MERGE, ActionQueue.COALESCE_REPLACE
+        always = ActionQueue.NO_TIMEOUT  # tokens whose loss leaves the device in a wrong state
+
+        self.actionQueue.register('set_location', self.onSetLocation, normal, replace)
+        self.actionQueue.register('refresh', self.onRefresh, low, replace)
+        self.actionQueue.register('refresh_assistant', self.onRefreshAssistant, normal, replace)
+        self.actionQueue.register('set_auto_interval', self.onSetAutoInterval, normal, replace)
+        self.actionQueue.register('music_autoplay', self.onMusicAutoplay, high)
+        self.actionQueue.register('music_force_play', self.onMusicForcePlay, high)
+        self.actionQueue.register('music_force_pause', self.onMusicForcePause, high)
+        self.actionQueue.register('music_next', self.onMusicNext, high)
+        self.actionQueue.register('music_prev', self.onMusicPrev, high)
+        self.actionQueue.register('play_music_by_keyword', self.onPlayMusicByKeyword, high)  # music commands keep their order
+        self.actionQueue.register('play_music_by_emotion', self.onPlayMusicByEmotion, high)
+        self.actionQueue.register('moisture', self.onMoisture, normal)
+        self.actionQueue.register('style', self.onStyle, normal)
+        self.actionQueue.register('assistant', self.onAssistant, high, timeout=always)
+        self.actionQueue.register('assistant_msg', self.onAssistantMsg, high, replace, timeout=always)
+        self.actionQueue.register('master_volume_up', self.onMasterVolumeUp, high, merge, timeout=always)
+        self.actionQueue.register('master_volume_down', self.onMasterVolumeDown, high, merge, timeout=always)
+        self.actionQueue.register('vlc_volume_up', self.onVlcVolumeUp, high, replace, timeout=always)
+        self.actionQueue.register('vlc_volume_down', self.onVlcVolumeDown, high, replace, timeout=always)
+
     def takeAction(self, token):
-        if not self.actionValid:
+        # Tokens arrived while an action is running are queued (not dropped)
+        if self.actionQueue.push(token):
+            QTimer.singleShot(0, self.processActions)
+
+    def processActions(self):
+        if self.actionRunning or len(self.actionQueue) == 0:
+            return  # called again when the running action is finished (actions can open modal dialogs)
+
+        action = self.actionQueue.pop()
+        context = ActionContext(action, self.actionFinishedTime)
+        if context.expired():
+            logging.warning(f"[ACTION] Action {action.token['type']} is dropped: waited {context.elapsed():.1f}s")
+            self.actionMetrics.recordExpired(action.token['type'])
+            if len(self.actionQueue) > 0:
+                QTimer.singleShot(0, self.processActions)
             return
-        self.actionValid = False
 
-        if token['type'] == 'set_location':
-            changeSettings('lat', token['args'][0])
-            changeSettings('lon', token['args'][1])
-            saveSettings()
-            self.weatherDownloader.refreshLocation()
-            self.refresh()
-        
-        elif token['type'] == 'refresh':
-            # self.refresh()
-            self.progressbarWidget.setValue(0)
-            self.refreshedTime = QTime.currentTime()
-            self.progressbarWidget.setValue(10)
-            self.deleteLayout(self.mainLayout)  # remove main layout
-            self.progressbarWidget.setValue(50)
-            self.drawWindow()  # regenerate main layout and set widget layout as main layout
+        self.actionRunning = True
+        start = time.perf_counter()
+        try:
+            action.method(action.token, context)
+        except Exception as error:
+            logging.error(f"[ACTION] Error occurred on action {action.token['type']}: {error}")
+        finally:
+            self.actionRunning = False
+            self.actionFinishedTime = time.perf_counter()
+            self.actionMetrics.record(action.token['type'], start - action.queuedTime, time.perf_counter() - start, action.count)
+            if len(self.actionQueue) > 0:
+                QTimer.singleShot(0, self.processActions)
+
+    def startCamera(self):
+        try:
+            camera = getFeature('camera')
+            if camera is not None:
+                camera.start()
+        except Exception as error:
+            logging.error(f'[CAMERA] Cannot start camera: {error}')
+
+    def checkOnline(self, context):
+        if context.online:
+            return True
+        alertDialog = AlertDialog(title='인터넷 연결 장애', msg='인터넷 연결이 원활하지 않습니다', timeout=3, parent=self)
+        alertDialog.exec_()
+        return False
+
+    def onSetLocation(self, token, context):
+        changeSettings('lat', token['args'][0])
+        changeSettings('lon', token['args'][1])
+        saveSettings()
+        self.weatherDownloader.refreshLocation()
+        self.refresh()
+
+    def onRefresh(self, token, context):
+        self.progressbarWidget.setValue(0)
+        self.refresh()
+        self.progressbarWidget.setValue(50)  # set to 100 when all the fetched data arrived
+
+        alertDialog = AlertDialog(title='새로고침', msg='화면이 새로고침 되었습니다', timeout=3, parent=self)
+        alertDialog.exec_()
+
+    def onRefreshAssistant(self, token, context):
+        self.refresh()
+        self.assistantPanel.update(token['args'][0])
+
+    def onSetAutoInterval(self, token, context):
+        changeSettings('refresh_term', token['args'][0])
+        self.refresh()
+
+    def onMusicAutoplay(self, token, context):
+        self.jobExecutor.cancel('music')  # newer music command replaces the pending search
+        if len(token['args']) > 0:
+            self.assistantPanel.update(token['args'][0])
+
+        if not self.musicPlayerModule.manager.isInvalid():
+            if not self.musicPlayerModule.manager.isStopped():
+                self.musicPlayerModule.manager.pause()
+            else:
+                self.musicPlayerModule.manager.play()
 
-            alertDialog = AlertDialog(title='새로고침', msg='화면이 새로고침 되었습니다', timeout=3, parent=self)
-            alertDialog.exec_()
+    def onMusicForcePlay(self, token, context):
+        self.jobExecutor.cancel('music')  # newer music command replaces the pending search
+        if self.musicPlayerModule.manager.isInvalid():
+            self.assistantPanel.update('음악을 재생할 수 없습니다')
+            return
 
-        elif token['type'] == 'refresh_assistant':
-            self.refresh()
-            self.assistantMsgLabel.setText(token['args'][0])
+        if len(token['args']) > 0:
+            self.assistantPanel.update(token['args'][0])
+        self.musicPlayerModule.manager.play()
 
-        elif token['type'] == 'set_auto_interval':
-            changeSettings('refresh_term', token['args'][0])
-            self.refresh()
+    def onMusicForcePause(self, token, context):
+        self.jobExecutor.cancel('music')  # newer music command replaces the pending search
+        if self.musicPlayerModule.manager.isInvalid():
+            self.assistantPanel.update('음악을 재생할 수 없습니다')
+            return
 
-        elif token['type'] == 'music_autoplay':
-            if checkWifiConnection():
-                alertDialog = AlertDialog(title='인터넷 연결 장애', msg='인터넷 연결이 원활하지 않습니다', timeout=3, parent=self)
-                alertDialog.exec_()
-                return
+        if len(token['args']) > 0:
+            self.assistantPanel.update(token['args'][0])
+        self.musicPlayerModule.manager.pause()
 
-            if len(token['args']) > 0:
-                self.assistantMsgLabel.setText(token['args'][0])
+    def onMusicNext(self, token, context):
+        self.jobExecutor.cancel('music')  # newer music command replaces the pending search
+        if self.musicPlayerModule.manager.isInvalid():
+            self.assistantPanel.update('음악을 재생할 수 없습니다')
+            return
 
-            if not self.musicPlayerModule.manager.isInvalid():
-                if not self.musicPlayerModule.manager.isStopped():
-                    self.musicPlayerModule.manager.pause()
-                else:
-                    self.musicPlayerModule.manager.play()
+        if len(token['args']) > 0:
+            self.assistantPanel.update(token['args'][0])
 
-        elif token['type'] == 'music_force_play':
-            if self.musicPlayerModule.manager.isInvalid():
-                self.assistantMsgLabel.setText('음악을 재생할 수 없습니다')
-                return
+        if not self.musicPlayerModule.manager.isInvalid():
+            self.musicPlayerModule.manager.moveNext()
 
-            if checkWifiConnection():
-                alertDialog = AlertDialog(title='인터넷 연결 장애', msg='인터넷 연결이 원활하지 않습니다', timeout=3, parent=self)
-                alertDialog.exec_()
-                return
+    def onMusicPrev(self, token, context):
+        self.jobExecutor.cancel('music')  # newer music command replaces the pending search
+        if self.musicPlayerModule.manager.isInvalid():
+            self.assistantPanel.update('음악을 재생할 수 없습니다')
+            return
 
-            if len(token['args']) > 0:
-                self.assistantMsgLabel.setText(token['args'][0])
-            self.musicPlayerModule.manager.play()
+        if len(token['args']) > 0:
+            self.assistantPanel.update(token['args'][0])
 
-        elif token['type'] == 'music_force_pause':
-            if self.musicPlayerModule.manager.isInvalid():
-                self.assistantMsgLabel.setText('음악을 재생할 수 없습니다')
-                return
+        if not self.musicPlayerModule.manager.isInvalid():
+            self.musicPlayerModule.manager.movePrev()
+
+    def onPlayMusicByKeyword(self, token, context):
+        if not self.checkOnline(context):
+            return
 
-            if len(token['args']) > 0:
-                self.assistantMsgLabel.setText(token['args'][0])
+        if not self.musicPlayerModule.manager.isStopped():
             self.musicPlayerModule.manager.pause()
-        
-        elif token['type'] == 'music_next':
-            if self.musicPlayerModule.manager.isInvalid():
-                self.assistantMsgLabel.setText('음악을 재생할 수 없습니다')
-                return
-
-            if checkWifiConnection():
-                alertDialog = AlertDialog(title='인터넷 연결 장애', msg='인터넷 연결이 원활하지 않습니다', timeout=3, parent=self)
-                alertDialog.exec_()
-                return
-
-            if len(token['args']) > 0:
-                self.assistantMsgLabel.setText(token['args'][0])
-
-            if checkWifiConnection():
-                alertDialog = AlertDialog(title='인터넷 연결 장애', msg='인터넷 연결이 원활하지 않습니다', timeout=3, parent=self)
-                alertDialog.exec_()
-                return
-
-            if not self.musicPlayerModule.manager.isInvalid():
-                self.musicPlayerModule.manager.moveNext()
-        
-        elif token['type'] == 'music_prev':
-            if self.musicPlayerModule.manager.isInvalid():
-                self.assistantMsgLabel.setText('음악을 재생할 수 없습니다')
-                return
+        self.progressbarWidget.setValue(0)
+        self.jobExecutor.submit('music', self.searchMusic, token['args'][1], onDone=self.acceptMusicSearched)
+        self.assistantPanel.update(token['args'][0])
 
-            if checkWifiConnection():
-                alertDialog = AlertDialog(title='인터넷 연결 장애', msg='인터넷 연결이 원활하지 않습니다', timeout=3, parent=self)
-                alertDialog.exec_()
-                return
+    def onPlayMusicByEmotion(self, token, context):
+        if not self.checkOnline(context):
+            return
 
-            if len(token['args']) > 0:
-                self.assistantMsgLabel.setText(token['args'][0])
+        if len(token['args']) > 0:
+            self.assistantPanel.update(token['args'][0])
 
-            if not self.musicPlayerModule.manager.isInvalid():
-                self.musicPlayerModule.manager.movePrev()
+        self.startCamera()  # camera warms up while the prompt is shown
+        alertDialog = AlertDialog(title='표정 분석', msg='표정 분석을 위해 얼굴을 비추세요', timeout=3, parent=self)
+        alertDialog.exec_()
 
-        elif token['type'] == 'play_music_by_keyword':
-            if checkWifiConnection():
-                alertDialog = AlertDialog(title='인터넷 연결 장애', msg='인터넷 연결이 원활하지 않습니다', timeout=3, parent=self)
-                alertDialog.exec_()
-                return
+        self.progressbarWidget.setValue(0)
 
-            if not self.musicPlayerModule.manager.isStopped():
-                self.musicPlayerModule.manager.pause()
-            self.musicPlayerModule.manager.search(token['args'][1])
-            self.musicPlayerModule.manager.play()
-            self.assistantMsgLabel.setText(token['args'][0])
+        if not self.musicPlayerModule.manager.isStopped():
+            self.musicPlayerModule.manager.pause()
+        self.jobExecutor.submit('music', self.searchMusicByEmotion, onDone=self.acceptMusicSearchedByEmotion)
 
-        elif token['type'] == 'play_music_by_emotion':
-            if checkWifiConnection():
-                alertDialog = AlertDialog(title='인터넷 연결 장애', msg='인터넷 연결이 원활하지 않습니다', timeout=3, parent=self)
-                alertDialog.exec_()
-                return
+    def onMoisture(self, token, context):
+        msg = ""
+        measured_results = []
+        error_flag = False
+        median_value = -1
 
-            if len(token['args']) > 0:
-                self.assistantMsgLabel.setText(token['args'][0])
+        if len(token['args']) > 0:
+            self.assistantPanel.update(token['args'][0])
 
-            alertDialog = AlertDialog(title='표정 분석', msg='표정 분석을 위해 얼굴을 비추세요', timeout=3, parent=self)
-            alertDialog.exec_()
+        alertDialog = AlertDialog(title='피부 상태 분석', msg='피부 상태 분석을 위해 센서를 피부와 접촉하세요', timeout=3, parent=self)
+        alertDialog.exec_()
 
-            self.progressbarWidget.setValue(0)
+        self.progressbarWidget.setValue(0)
 
-            if not self.musicPlayerModule.manager.isStopped():
-                self.musicPlayerModule.manager.pause()
-            result_valid = self.musicPlayerModule.manager.searchByEmotion()
+        try:
+            measured_results = self.moistureModule.measure(max_cnt=7, time_interval=0.5)
+            self.progressbarWidget.setValue(30)
+            measured_results.sort()
+            median_value = measured_results[len(measured_results) // 2]
+            median_value = int((median_value - 24) * 4)
+            if median_value < 0:   median_value = 0
+            if median_value > 100: median_value = 100
             self.progressbarWidget.setValue(50)
-            msg = "표정 분석에 실패했습니다"
-
-            if result_valid and result_valid != 'invalid':
-                self.musicPlayerModule.manager.play()
-                msg=f"현재 감정 상태: {result_valid}\n적절한 음악을 재생합니다"
+            msg = f"측정된 결과는 다음과 같습니다: {median_value}"
+            # msg = f"측정된 결과는 {measured_results}"
+            if len(measured_results) < 4:
+                msg += '\n경고: 결과값이 부족하여 측정된 결과가 정확하지 않을 수 있습니다.'
+        except:
+            msg = "측정 중 심각한 오류가 발생하였습니다.\n센서가 제대로 동작하고 있는지 확인하세요."
+            error_flag = True
 
-            self.progressbarWidget.setValue(100)
+        self.progressbarWidget.setValue(70)
 
-            alertDialog = AlertDialog(title='표정 분석', msg=msg, timeout=5, parent=self)
-            alertDialog.exec_()
-
-        elif token['type'] == 'moisture':
-            if checkWifiConnection():
-                alertDialog = AlertDialog(title='인터넷 연결 장애', msg='인터넷 연결이 원활하지 않습니다', timeout=3, parent=self)
-                alertDialog.exec_()
-                return
-
-            msg = ""
-            measured_results = []
-            error_flag = False
-            median_value = -1
-
-            if len(token['args']) > 0:
-                self.assistantMsgLabel.setText(token['args'][0])
-
-            alertDialog = AlertDialog(title='피부 상태 분석', msg='피부 상태 분석을 위해 센서를 피부와 접촉하세요', timeout=3, parent=self)
-            alertDialog.exec_()
-
-            self.progressbarWidget.setValue(0)
-
-            try:
-                measured_results = self.moistureModule.measure(max_cnt=7, time_interval=0.5)
-                self.progressbarWidget.setValue(30)
-                measured_results.sort()
-                median_value = measured_results[len(measured_results) // 2]
-                median_value = int((median_value - 24) * 4)
-                if median_value < 0:   median_value = 0
-                if median_value > 100: median_value = 100
-                self.progressbarWidget.setValue(50)
-                msg = f"측정된 결과는 다음과 같습니다: {median_value}"
-                # msg = f"측정된 결과는 {measured_results}"
-                if len(measured_results) < 4:
-                    msg += '\n경고: 결과값이 부족하여 측정된 결과가 정확하지 않을 수 있습니다.'
-            except:
-                msg = "측정 중 심각한 오류가 발생하였습니다.\n센서가 제대로 동작하고 있는지 확인하세요."
-                error_flag = True
+        if median_value != -1 and not error_flag:  # Save to local store (exported to google drive storage)
+            today = datetime.date.today()
+            self.skinConditionUploader.upload(median_value, today)
+            monthly_mean = self.skinConditionUploader.store.monthlyMean(today.year, today.month)
+            if monthly_mean is not None:
+                msg += f'\n이번 달 평균: {monthly_mean:.1f}'
 
-            self.progressbarWidget.setValue(70)
+        self.progressbarWidget.setValue(100)
 
-            if median_value != -1 and not error_flag:  # Upload to google drive storage
-                self.skinConditionUploader.upload(median_value, datetime.date.today())
+        alertDialog = AlertDialog(title='피부 수분측정', msg=msg, timeout=5, parent=self)
+        alertDialog.exec_()
 
-            self.progressbarWidget.setValue(100)
-
-            alertDialog = AlertDialog(title='피부 수분측정', msg=msg, timeout=5, parent=self)
-            alertDialog.exec_()
-
-        elif token['type'] == 'style':
-            if checkWifiConnection():
-                alertDialog = AlertDialog(title='인터넷 연결 장애', msg='인터넷 연결이 원활하지 않습니다', timeout=3, parent=self)
-                alertDialog.exec_()
-                return
+    def onStyle(self, token, context):
+        if not self.checkOnline(context):
+            return
 
-            msg = ""
-            results = None
+        msg = ""
+        results = None
 
-            if len(token['args']) > 0:
-                self.assistantMsgLabel.setText(token['args'][0])
+        if len(token['args']) > 0:
+            self.assistantPanel.update(token['args'][0])
 
-            alertDialog = AlertDialog(title='스타일 분석', msg='스타일 분석을 위해 전신을 비추세요\n창이 닫히면 스타일을 특정합니다', timeout=5, parent=self)
-            alertDialog.exec_()
-            self.progressbarWidget.setValue(0)
+        self.startCamera()  # camera warms up while the prompt is shown
+        alertDialog = AlertDialog(title='스타일 분석', msg='스타일 분석을 위해 전신을 비추세요\n창이 닫히면 스타일을 특정합니다', timeout=5, parent=self)
+        alertDialog.exec_()
+        self.progressbarWidget.setValue(0)
 
-            try:
-                self.styleRecommendationManager.capture()
-                self.progressbarWidget.setValue(20)
-                results = self.styleRecommendationManager.search()
-                self.progressbarWidget.setValue(50)
-                self.styleRecommendationManager.upload(targetData=results)
-                self.progressbarWidget.setValue(70)
-                msg = "분석 결과를 스마트폰을 통해 확인하세요"
-            except:
-                msg = "분석 중 심각한 오류가 발생하였습니다.\n카메라가 제대로 동작하고 있는지 확인하세요."
+        try:
+            self.styleRecommendationManager.capture()
+            self.progressbarWidget.setValue(20)
+            results = self.styleRecommendationManager.search()
+            self.progressbarWidget.setValue(50)
+            self.styleRecommendationManager.upload(targetData=results)
+            self.progressbarWidget.setValue(70)
+            msg = "분석 결과를 스마트폰을 통해 확인하세요"
+        except:
+            msg = "분석 중 심각한 오류가 발생하였습니다.\n카메라가 제대로 동작하고 있는지 확인하세요."
 
-            self.progressbarWidget.setValue(100)
-            alertDialog = AlertDialog(title='스타일 분석', msg=msg, timeout=5, parent=self)
-            alertDialog.exec_()
-        
-        elif token['type'] == 'assistant':
-            if checkWifiConnection():
-                alertDialog = AlertDialog(title='인터넷 연결 장애', msg='인터넷 연결이 원활하지 않습니다', timeout=3, parent=self)
-                alertDialog.exec_()
-                return
+        self.progressbarWidget.setValue(100)
+        alertDialog = AlertDialog(title='스타일 분석', msg=msg, timeout=5, parent=self)
+        alertDialog.exec_()
 
-            self.assistantThread.trigger()
+    def onAssistant(self, token, context):
+        if not self.checkOnline(context):
+            return
 
-        elif token['type'] == 'assistant_msg':
-            self.assistantMsgLabel.setText(token['args'][0])
+        self.assistantThread.trigger()
 
-        elif token['type'] == 'master_volume_up':
-            self.audioModule.volumnUp()
+    def onAssistantMsg(self, token, context):
+        self.assistantPanel.update(token['args'][0])
 
-        elif token['type'] == 'master_volume_down':
-            self.audioModule.volumnDown()
+    def onMasterVolumeUp(self, token, context):
+        self.audioModule.volumnUp(steps=token.get('count', 1))
 
-        elif token['type'] == 'vlc_volume_up':
-            self.musicPlayerModule.manager.volumnUp()
+    def onMasterVolumeDown(self, token, context):
+        self.audioModule.volumnDown(steps=token.get('count', 1))
 
-        elif token['type'] == 'vlc_volume_down':
-            self.musicPlayerModule.manager.volumeDown()
+    def onVlcVolumeUp(self, token, context):
+        self.musicPlayerModule.manager.volumnUp()
 
-        self.actionValid = True
+    def onVlcVolumeDown(self, token, context):
+        self.musicPlayerModule.manager.volumeDown()
 
 
 if __name__ == '__main__':
@@ -1062,4 +1588,5 @@ if __name__ == '__main__':
 
 
     # Running the application
+    QTimer.singleShot(0, startupTimeline.log)  # print startup timeline after the first frame
     sys.exit(app.exec_())
\ No newline at end of file
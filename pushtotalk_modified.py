@@ -252,6 +252,8 @@ class SampleAssistant(object):
         device_actions_futures = []
 
         self.conversation_stream.start_recording()
+        if assistant_trigger is not None:
+            assistant_trigger.markRecording()
         logging.info('Recording audio request.')
 
         def iter_log_assist_requests():
@@ -611,12 +613,11 @@ def main(api_endpoint, credentials, project_id,
             if wait_for_user_trigger:
                 # if external trigger is defined, use external trigger
                 if assistant_trigger is not None:
-                    while True:
-                        if assistant_trigger.istriggered():
-                            if message_listener is not None:
-                                message_listener.edit('음성을 입력하세요', None)
-                                message_listener.edit('', ActionToken(name='vlc_volume_down'))
-                            break
+                    if not assistant_trigger.wait():  # blocks until triggered (False if cancelled)
+                        break
+                    if message_listener is not None:
+                        message_listener.edit('음성을 입력하세요', None)
+                        message_listener.edit('', ActionToken(name='vlc_volume_down'))
                 else:
                     click.pause(info='')
                 # END
@@ -1,3 +1,5 @@
 # Installing required packages for face detection and azure face API
 python3 -m pip install datetime imutils opencv-python requests Pillow
-python3 -m pip install --upgrade azure-cognitiveservices-vision-face
\ No newline at end of file
+python3 -m pip install --upgrade azure-cognitiveservices-vision-face
+# Model for local emotion backend ("face-emotion-backend": "local" in config.json)
+wget -nc -P model https://github.com/onnx/models/raw/main/validated/vision/body_analysis/emotion_ferplus/model/emotion-ferplus-8.onnx